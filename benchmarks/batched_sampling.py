@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+ThreeSceneGenerator sampling: one latent batch of 3 vs one sampler run per scene
+
+Runs ThreeSceneGenerator with CPU stand-ins for the model, VAE and sampler, then
+samples each scene on its own with its seed and conditioning (what the shipped
+workflow does with three KSamplers and three VAE Decodes). Checks that every
+image matches and prints the timings, forward passes and VAE calls.
+
+    python benchmarks/batched_sampling.py [--steps 20] [--size 256] [--latency-ms 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storyboard_nodes
+from storyboard_nodes import ThreeSceneGenerator, _batch_conditioning, _encode_texts, _sample_batch, _zero_conditioning
+from stubs import StubCLIP, StubDiffusionModel, StubVAE, stub_sample
+from batched_encoding import SCENES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--size", type=int, default=256, help="image width and height")
+    parser.add_argument("--cfg", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1111111)
+    parser.add_argument("--latency-ms", type=float, default=5.0,
+                        help="fixed cost per model forward pass / VAE call, standing in for kernel launches and transfers")
+    args = parser.parse_args()
+
+    storyboard_nodes._comfy_sample = stub_sample  # the node samples with comfy.sample.sample
+    clip = StubCLIP()
+    model = StubDiffusionModel(latency=args.latency_ms / 1000)
+    vae = StubVAE(latency=args.latency_ms / 1000)
+    settings = dict(width=args.size, height=args.size, steps=args.steps, cfg=args.cfg,
+                    sampler_name="euler", scheduler="simple")
+
+    start = time.perf_counter()
+    batched = ThreeSceneGenerator().generate_three_scenes(
+        *SCENES, model, clip, vae, seed=args.seed, debug="disable", **settings
+    )
+    batch_time = time.perf_counter() - start
+    batch_calls, batch_decodes = list(model.calls), list(vae.decode_calls)
+
+    model.calls.clear()
+    vae.decode_calls.clear()
+    start = time.perf_counter()
+    separate = []
+    for i, encoded in enumerate(_encode_texts(clip, SCENES)):
+        positive = _batch_conditioning([encoded], {"guidance": 3.5})
+        separate.append(_sample_batch(model, vae, positive, _zero_conditioning(positive), [args.seed + i],
+                                      sample=stub_sample, **settings))
+    loop_time = time.perf_counter() - start
+
+    print(f"per scene: {loop_time * 1e3:8.1f} ms   {len(model.calls)} forward passes {sorted(set(model.calls))}, VAE decodes {vae.decode_calls}")
+    print(f"batched:   {batch_time * 1e3:8.1f} ms   {len(batch_calls)} forward passes {sorted(set(batch_calls))}, VAE decodes {batch_decodes}")
+    print(f"speedup:   {loop_time / batch_time:.2f}x")
+
+    for i, (a, b) in enumerate(zip(batched, separate)):
+        if a.shape != b.shape or not torch.allclose(a, b, atol=1e-4):
+            print(f"Scene {i + 1} differs between batched and per-scene sampling")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Import time of the text modules, and a check that they stay free of torch
+
+Imports scene_text and storyboard_nodes in fresh interpreters, reports the median
+import time and fails if an import loads torch, numpy or PIL, or takes longer than
+its budget.
+
+    python benchmarks/import_time.py [--runs 7] [--scene-text-ms 50] [--nodes-ms 200]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["torch", "numpy", "PIL.Image"]
+
+CHILD = """
+import importlib, json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - start
+# Lazily imported modules sit in sys.modules as importlib's _LazyModule until first use
+loaded = [name for name in {heavy!r} if name in sys.modules and type(sys.modules[name]).__name__ != "_LazyModule"]
+print(json.dumps([elapsed, loaded]))
+"""
+
+
+def measure(module, runs):
+    times = []
+    loaded = []
+    for _ in range(runs):
+        code = CHILD.format(root=ROOT, module=module, heavy=HEAVY)
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        elapsed, loaded = json.loads(result.stdout)
+        times.append(elapsed)
+    return statistics.median(times), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--scene-text-ms", type=float, default=50.0)
+    parser.add_argument("--nodes-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget in [("scene_text", args.scene_text_ms), ("storyboard_nodes", args.nodes_ms)]:
+        elapsed, loaded = measure(module, args.runs)
+        ok = elapsed * 1000 <= budget and not loaded
+        failed |= not ok
+        print(f"{module:>16}: {elapsed * 1000:6.1f} ms (budget {budget:.0f} ms)"
+              f"{', loaded ' + ', '.join(loaded) if loaded else ''}{'' if ok else '  FAIL'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the parser and compositor hot paths, saved as JSON
+
+Times parse_scene_text (scene splitting and constants extraction, which run in a
+single scan) over synthetic LLM outputs in every format the parser recognises
+(the headers from llm_prompt_examples.md, bullets, parentheticals, Note:, the
+first-scene fallback and text with nothing to match) at growing sizes,
+apply_scene_constants for every format and position, and compose_storyboard
+across layouts, panel sizes and label/caption settings.
+
+Each case reports the median and best time per call over several runs. Save a
+baseline, then compare a later run against it; cases slower than the baseline by
+more than --threshold are flagged and the script exits non-zero.
+
+    python benchmarks/microbench.py -o baseline.json
+    python benchmarks/microbench.py --compare baseline.json [--threshold 0.25] [-o current.json]
+    python benchmarks/microbench.py --compare baseline.json current.json   # compare two saved runs
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scene_text import apply_scene_constants, parse_scene_text
+
+
+CONSTANTS = "1 girl around 25 years old, homeless looking, at a cabin in the woods, gloomy and country aesthetic"
+SCENES = [
+    "A girl sits on the front steps of a cabin, lost in thought. A car pulls up to the cabin and parks nearby.",
+    "The crows scatter from the sagging eaves and caw loudly at the newcomer stepping out of the car.",
+    "The girl stands and studies the stranger with a guarded expression while crows perch nearby.",
+]
+FILLER = "The humidity presses down on everything and the light fades behind the pines. "
+
+
+def scene_block(size):
+    """Scene 1..3 whose bodies are padded so the block is about size bytes"""
+    padding = max(size // 3 - 120, 0)
+    filler = (FILLER * (padding // len(FILLER) + 1))[:padding]
+    return "\n\n".join(f"Scene {i + 1}:\n{scene} {filler}" for i, scene in enumerate(SCENES))
+
+
+# Builders for each LLM output format, given the target size in bytes
+FORMATS = {
+    "direct": lambda size: f"Constants: {CONSTANTS}\n\n{scene_block(size)}",
+    "visual_constants": lambda size: f"Visual Constants: {CONSTANTS}\n\n{scene_block(size)}",
+    "descriptive": lambda size: (
+        "Character Description: A young woman around 25 years old with a weathered, homeless appearance\n\n"
+        "Setting Description: Isolated cabin in the woods with a dark, gloomy country aesthetic\n\n" + scene_block(size)),
+    "bullets": lambda size: (
+        "• Character: 1 girl around 25 years old, homeless looking\n• Setting: a cabin in the woods\n"
+        "• Style: gloomy and country aesthetic\n\n" + scene_block(size)),
+    "parenthetical": lambda size: f"(For all scenes: {CONSTANTS})\n\n{scene_block(size)}",
+    "note": lambda size: f"Note: keep these constant throughout: {CONSTANTS}\n\n{scene_block(size)}",
+    "first_scene_fallback": lambda size: scene_block(size).replace(
+        "A girl sits", "A 1 girl around 25 years old sits, homeless looking,", 1),
+    "no_match": lambda size: "\n\n".join(
+        (FILLER * (size // 3 // len(FILLER) + 1))[:size // 3] for _ in range(3)),
+}
+
+PARSE_SIZES_KB = [1, 8, 64]
+CONSTANTS_FORMATS = ["natural", "tags", "descriptive"]
+CONSTANTS_POSITIONS = ["beginning", "end", "both"]
+COMPOSE_LAYOUTS = ["vertical", "horizontal", "grid"]
+COMPOSE_SIZES = [256, 512, 1024]
+COMPOSE_LABELS = ["none", "labels", "labels+captions"]
+
+
+def measure(func, runs=5, min_time=0.05):
+    """Median and best seconds per call, calling func enough times per run to take min_time"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed * 10 >= min_time else 10
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        times.append((time.perf_counter() - start) / loops)
+    return {"median": statistics.median(times), "best": min(times), "loops": loops, "runs": runs}
+
+
+def parse_cases(sizes):
+    for name, build in FORMATS.items():
+        for size_kb in sizes:
+            text = build(size_kb * 1024)
+            yield f"parse/{name}/{size_kb}kb", lambda text=text: parse_scene_text(text), len(text)
+
+
+def constants_cases():
+    for format_type in CONSTANTS_FORMATS:
+        for position in CONSTANTS_POSITIONS:
+            yield (f"constants/{format_type}/{position}",
+                   lambda f=format_type, p=position: apply_scene_constants(SCENES, CONSTANTS, p, f), None)
+
+
+def compose_cases(sizes):
+    import torch
+    from storyboard_nodes import compose_storyboard
+
+    torch.manual_seed(0)
+    for size in sizes:
+        images = [torch.rand(1, size, size, 3) for _ in range(3)]
+        for layout in COMPOSE_LAYOUTS:
+            for labels in COMPOSE_LABELS:
+                add_labels = "disable" if labels == "none" else "enable"
+                captions = SCENES if labels.endswith("captions") else None
+                yield (f"compose/{layout}/{size}px/{labels}",
+                       lambda i=images, l=layout, a=add_labels, c=captions: compose_storyboard(i, l, 10, "white", a, captions=c),
+                       size * size * 3)
+
+
+def run(args):
+    cases = [parse_cases(args.parse_sizes), constants_cases()]
+    if not args.skip_compose:
+        cases.append(compose_cases(args.compose_sizes))
+
+    results = {}
+    for group in cases:
+        for name, func, input_size in group:
+            if args.filter and not any(f in name for f in args.filter):
+                continue
+            func()  # warm up caches and lazy imports
+            result = measure(func, args.runs, args.min_time)
+            if input_size is not None:
+                result["input_size"] = input_size
+            results[name] = result
+            print(f"{name:<45} {result['median'] * 1e6:>12.1f} us  (best {result['best'] * 1e6:.1f} us)")
+
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+    if "torch" in sys.modules:
+        meta["torch"] = sys.modules["torch"].__version__
+    return {"meta": meta, "results": results}
+
+
+def compare(baseline, current, threshold, min_delta):
+    """Print per-case changes, returns the names of cases that regressed"""
+    regressions = []
+    print(f"\n{'case':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<45} {'-':>12} {result['median'] * 1e6:>10.1f}us {'new':>8}")
+            continue
+        # Compare best times, which are the least sensitive to noise from other processes
+        change = result["best"] / before["best"] - 1
+        flag = ""
+        if change > threshold and result["best"] - before["best"] > min_delta:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<45} {before['best'] * 1e6:>10.1f}us {result['best'] * 1e6:>10.1f}us {change:>+8.1%}{flag}")
+
+    missing = sorted(set(baseline["results"]) - set(current["results"]))
+    if missing:
+        print(f"{len(missing)} baseline case(s) not in this run")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", nargs="+", metavar="JSON",
+                        help="baseline JSON to compare this run against, or a baseline and a current JSON to compare without running")
+    parser.add_argument("--threshold", type=float, default=0.25, help="flag cases slower than the baseline by more than this fraction")
+    parser.add_argument("--min-delta", type=float, default=2e-6, help="ignore slowdowns smaller than this many seconds per call")
+    parser.add_argument("--filter", nargs="+", help="only run cases whose name contains one of these strings")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per run, calls are repeated to reach it")
+    parser.add_argument("--parse-sizes", type=int, nargs="+", default=PARSE_SIZES_KB, help="LLM output sizes in KB")
+    parser.add_argument("--compose-sizes", type=int, nargs="+", default=COMPOSE_SIZES, help="panel widths and heights")
+    parser.add_argument("--skip-compose", action="store_true", help="skip the compositor cases (no torch needed)")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes a baseline JSON and optionally a current JSON")
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+    else:
+        current = run(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved {len(current['results'])} results to {args.output}")
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare[0]) as f:
+        baseline = json.load(f)
+    regressions = compare(baseline, current, args.threshold, args.min_delta)
+    if regressions:
+        print(f"FAIL: {len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"OK: no case regressed by more than {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
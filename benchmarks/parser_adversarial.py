@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Adversarial benchmark for the scene/constants parser
+
+Runs parse_scene_text over inputs built to trigger regex backtracking (unclosed
+parentheticals, Note: without a colon, sentences with no period, long digit and
+punctuation runs) plus random fuzz made of constants labels, at growing sizes.
+Time per KB must stay flat; the script exits non-zero if it grows.
+
+    python benchmarks/parser_adversarial.py [--max-kb 800] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scene_text import parse_scene_text
+
+
+FRAGMENTS = [
+    "Scene 1:", "Scene 2:", "Scene 3:", "Scene 12:", "Constants:", "Scene Constants:", "Character description:",
+    "For consistency:", "• Style:", "- Setting:", "(For all scenes:", "(Constants:", ")", "Note:", "constant",
+    "throughout", "all scenes", ":", "\n", "\n\n", " ", ".", "!", "1 girl around 25 years old", "at a cabin",
+    "gloomy aesthetic", "in the woods", "She walks on", "25", "A",
+]
+
+
+def repeat_to(chunk, size):
+    return (chunk * (size // len(chunk) + 1))[:size]
+
+
+def fuzz(size, rng):
+    parts = []
+    length = 0
+    while length < size:
+        part = rng.choice(FRAGMENTS) + rng.choice(["", " ", "\n", "the quiet road "])
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)[:size]
+
+
+CASES = {
+    "unclosed_parenthetical": lambda size, rng: repeat_to("(For all scenes: crows ", size),
+    "note_without_colon": lambda size, rng: "Note: " + repeat_to("constant throughout ", size),
+    "character_without_age": lambda size, rng: "Scene 1: " + repeat_to("1 girl on the porch ", size),
+    "place_without_building": lambda size, rng: "Scene 1: " + repeat_to("at a bend in the road ", size),
+    "sentence_without_period": lambda size, rng: "Scene 1: " + repeat_to("she waits and watches ", size),
+    "digit_run": lambda size, rng: "Scene 1: " + "9" * size + ":",
+    "punctuation_run": lambda size, rng: "Constants: a girl in the woods" + "!" * size + "x",
+    "whitespace_headers": lambda size, rng: repeat_to("Scene" + " " * 500 + "x:", size),
+    "many_headers": lambda size, rng: repeat_to("Scene 4: ", size),
+    "fuzz": fuzz,
+}
+
+
+def time_parse(text, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parse_scene_text(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-kb", type=int, default=800, help="largest input size in KB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-growth", type=float, default=3.0,
+                        help="fail if time per KB at the largest size exceeds the smallest by this factor")
+    args = parser.parse_args()
+
+    sizes = []
+    size_kb = 25
+    while size_kb <= args.max_kb:
+        sizes.append(size_kb)
+        size_kb *= 2
+
+    print(f"{'case':26s}" + "".join(f"{kb:>10d}KB" for kb in sizes) + "   growth")
+    failed = []
+    for name, make in CASES.items():
+        rng = random.Random(args.seed)
+        per_kb = []
+        for kb in sizes:
+            per_kb.append(time_parse(make(kb * 1024, rng)) / kb)
+
+        growth = per_kb[-1] / per_kb[0]
+        print(f"{name:26s}" + "".join(f"{t * 1e6:>9.1f}us" for t in per_kb) + f"   {growth:5.2f}x")
+        if growth > args.max_growth:
+            failed.append(name)
+
+    print("\n(time per KB of input, best of 3)")
+    if failed:
+        print(f"Super-linear growth in: {', '.join(failed)}")
+        return 1
+    print("Runtime per KB stays flat for every case")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
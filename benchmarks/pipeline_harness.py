@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline harness: parse -> encode -> generate -> composite on CPU stand-ins
+
+Runs SceneParser, ThreeSceneGenerator and StoryboardCompositor (plus
+SceneToConditioning) the way a workflow would, with the stub CLIP, model, VAE and
+sampler from stubs.py, which record every tokenize(), encode_from_tokens(),
+encoder forward pass, model forward pass and VAE decode with its batch shape.
+Asserts the call counts and batch shapes for batched encoding, the conditioning
+cache, one-at-a-time encoding, ScenePromptPacker, LatentStoryboard and the
+scene image cache, then measures storyboards per second over
+fresh LLM outputs. --latency-ms adds a fixed cost to every encoder, model and VAE
+call to stand in for kernel launches and transfers on a real GPU.
+
+    python benchmarks/pipeline_harness.py [--runs 5] [--steps 4] [--size 256] [--latency-ms 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storyboard_nodes
+from storyboard_nodes import (LatentStoryboard, SceneImageCacheLookup, SceneImageCacheStore, SceneParser, ScenePromptPacker, SceneToConditioning,
+                              StoryboardCompositor, ThreeSceneGenerator, _conditioning_cache, _image_cache, _image_store)
+from stubs import StubCLIP, StubDiffusionModel, StubVAE, stub_sample
+
+
+def llm_output(run):
+    """Synthetic LLM output, different for every run so nothing is cached"""
+    return (
+        f"Constants: 1 girl around 25 years old, homeless looking, at a cabin in the woods, take {run}\n\n"
+        f"Scene 1: A girl sits on the front steps of a cabin as a car pulls up, run {run}.\n\n"
+        f"Scene 2: Crows scatter from the sagging eaves and caw at the newcomer, run {run}.\n\n"
+        f"Scene 3: The girl stands and studies the stranger with a guarded look, run {run}."
+    )
+
+
+class Pipeline:
+    def __init__(self, args):
+        latency = args.latency_ms / 1000
+        self.clip = StubCLIP(latency=latency)
+        self.model = StubDiffusionModel(latency=latency)
+        self.vae = StubVAE(latency=latency)
+        self.settings = dict(width=args.size, height=args.size, steps=args.steps, cfg=args.cfg, seed=args.seed,
+                             sampler_name="euler", scheduler="simple", debug="disable")
+        self.timings = {"parse": [], "generate": [], "composite": []}
+
+    def counts(self):
+        """Calls recorded so far, then reset"""
+        counts = {
+            "tokenize": self.clip.tokenize_calls,
+            "encode_from_tokens": self.clip.encode_from_tokens_calls,
+            "encoder_batches": self.clip.encoder_calls(),
+            "model_batches": list(self.model.calls),
+            "vae_batches": list(self.vae.decode_calls),
+        }
+        self.clip.reset_counts()
+        self.model.calls.clear()
+        self.vae.decode_calls.clear()
+        return counts
+
+    def run(self, text, batch_encode="enable", cache="enable", constants_mode=None):
+        start = time.perf_counter()
+        if constants_mode:
+            # Scenes without the constants pasted in, constants combined at the conditioning level
+            scene_1, scene_2, scene_3, _, constants = SceneParser().parse_scenes(text, "disable", constants_position="none")
+            options = dict(constants=constants, constants_mode=constants_mode)
+        else:
+            scene_1, scene_2, scene_3 = SceneParser().parse_scenes(text, "disable")[:3]
+            options = {}
+        parsed = time.perf_counter()
+        images = ThreeSceneGenerator().generate_three_scenes(scene_1, scene_2, scene_3, self.model, self.clip, self.vae,
+                                                             batch_encode=batch_encode, cache=cache, **options, **self.settings)
+        generated = time.perf_counter()
+        (storyboard,) = StoryboardCompositor().compose_storyboard(*images, "vertical", 10, "white", "enable", "disable",
+                                                                  caption_1=scene_1, caption_2=scene_2, caption_3=scene_3)
+        done = time.perf_counter()
+
+        self.timings["parse"].append(parsed - start)
+        self.timings["generate"].append(generated - parsed)
+        self.timings["composite"].append(done - generated)
+        return (scene_1, scene_2, scene_3), storyboard
+
+
+class Checks:
+    def __init__(self):
+        self.failures = []
+
+    def expect(self, label, actual, expected):
+        ok = actual == expected
+        print(f"  {'ok  ' if ok else 'FAIL'} {label}: {actual}" + ("" if ok else f" (expected {expected})"))
+        if not ok:
+            self.failures.append(label)
+
+
+def expected_model_batches(args, batch_size):
+    latent = (batch_size, 16, args.size // 8, args.size // 8)
+    return [latent] * (args.steps * (1 if args.cfg == 1.0 else 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="storyboards in the throughput measurement")
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--size", type=int, default=256, help="image width and height")
+    parser.add_argument("--cfg", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1111111)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="fixed cost per encoder, model and VAE call")
+    args = parser.parse_args()
+
+    storyboard_nodes._comfy_sample = stub_sample  # the node samples with comfy.sample.sample
+    pipeline = Pipeline(args)
+    checks = Checks()
+    latent = (3, 16, args.size // 8, args.size // 8)
+    _conditioning_cache.clear()
+
+    print("Batched encoding, empty cache:")
+    scenes, storyboard = pipeline.run(llm_output("cold"))
+    counts = pipeline.counts()
+    checks.expect("tokenize calls", counts["tokenize"], 3)
+    checks.expect("encode_from_tokens calls (1 batched + 3 replayed)", counts["encode_from_tokens"], 4)
+    checks.expect("encoder batches", counts["encoder_batches"], {"clip_l": [(3, 77)], "t5xxl": [(3, 256)]})
+    checks.expect("model forward passes", counts["model_batches"], expected_model_batches(args, 3))
+    checks.expect("VAE decodes", counts["vae_batches"], [latent])
+    checks.expect("storyboard batch and channels", tuple(storyboard.shape)[:1] + tuple(storyboard.shape)[3:], (1, 3))
+
+    print("Same LLM output again (conditioning cached):")
+    pipeline.run(llm_output("cold"))
+    counts = pipeline.counts()
+    checks.expect("tokenize calls", counts["tokenize"], 0)
+    checks.expect("encode_from_tokens calls", counts["encode_from_tokens"], 0)
+    checks.expect("model forward passes", len(counts["model_batches"]), len(expected_model_batches(args, 3)))
+    checks.expect("VAE decodes", counts["vae_batches"], [latent])
+
+    print("SceneToConditioning on a scene ThreeSceneGenerator already encoded:")
+    SceneToConditioning().encode_scene(scenes[0], pipeline.clip, "disable")
+    counts = pipeline.counts()
+    checks.expect("tokenize + encode_from_tokens calls", (counts["tokenize"], counts["encode_from_tokens"]), (0, 0))
+    SceneToConditioning().encode_scene(scenes[0], pipeline.clip, "disable", cache="disable")
+    counts = pipeline.counts()
+    checks.expect("with cache disabled", (counts["tokenize"], counts["encode_from_tokens"]), (1, 1))
+
+    print("One-at-a-time encoding, cache disabled:")
+    pipeline.run(llm_output("single"), batch_encode="disable", cache="disable")
+    counts = pipeline.counts()
+    checks.expect("tokenize calls", counts["tokenize"], 3)
+    checks.expect("encode_from_tokens calls", counts["encode_from_tokens"], 3)
+    checks.expect("encoder batches", counts["encoder_batches"], {"clip_l": [(1, 77)] * 3, "t5xxl": [(1, 256)] * 3})
+    checks.expect("model forward passes", counts["model_batches"], expected_model_batches(args, 3))
+    checks.expect("VAE decodes", counts["vae_batches"], [latent])
+
+    print("Constants encoded once and concatenated to each scene's conditioning:")
+    pipeline.run(llm_output("constants"), constants_mode="concat")
+    counts = pipeline.counts()
+    checks.expect("tokenize calls (3 scenes + constants)", counts["tokenize"], 4)
+    checks.expect("encoder batches", counts["encoder_batches"], {"clip_l": [(4, 77)], "t5xxl": [(4, 256)]})
+    checks.expect("model forward passes", counts["model_batches"], expected_model_batches(args, 3))
+    pipeline.run(llm_output("constants").replace("Scene 1: A girl", "Scene 1: The girl"), constants_mode="blend")
+    counts = pipeline.counts()
+    checks.expect("blend, only scene 1 changed (constants cached): tokenize calls", counts["tokenize"], 1)
+
+    print("ScenePromptPacker on constants pasted at both ends:")
+    # Scene 1 spills just past one 77 token chunk, scenes 2 and 3 fit
+    text = llm_output("packed").replace(" as a car pulls up", (
+        " as a dusty old car really just pulls up very slowly and parks in the tall weeds nearby, its engine ticking"
+        " quietly while the late afternoon light actually fades behind the tall pines and the girl, quite tired,"
+        " simply watches the dust settle"))
+    scenes = SceneParser().parse_scenes(text, "disable", constants_position="both")
+    constants = scenes[4]
+    packed = ScenePromptPacker().pack_scenes(*scenes[:3], pipeline.clip, 1, "disable", constants=constants)
+    counts = pipeline.counts()
+    checks.expect("chunk report", packed[3].splitlines()[0].split(" (")[0], "Scene 1: 1 chunk")
+    checks.expect("constants kept once", packed[0].count(constants.split(",")[0]), 1)
+    checks.expect("short scenes untouched", packed[1:3] == scenes[1:3], True)
+    checks.expect("tokenize calls (3 scenes + 1 trimmed)", counts["tokenize"], 4)
+
+    print("LatentStoryboard on 3 scene latents (KSampler outputs):")
+    latents = [{"samples": torch.randn(1, *latent[1:], generator=torch.Generator().manual_seed(i))} for i in range(3)]
+    (storyboard,) = LatentStoryboard().decode_storyboard(*latents, pipeline.vae, "vertical", 10, "white", "enable", "disable")
+    counts = pipeline.counts()
+    checks.expect("VAE decodes", counts["vae_batches"], [latent])
+    images = [pipeline.vae.decode(item["samples"]) for item in latents]
+    (expected,) = StoryboardCompositor().compose_storyboard(*images, "vertical", 10, "white", "enable", "disable")
+    pipeline.counts()
+    checks.expect("same storyboard as 3 VAE Decodes + StoryboardCompositor", torch.equal(storyboard, expected), True)
+    (tiled,) = LatentStoryboard().decode_storyboard(*latents, pipeline.vae, "vertical", 10, "white", "enable", "disable",
+                                                    decode="tiled", tile_size=args.size // 2)
+    counts = pipeline.counts()
+    checks.expect("tiled: VAE decodes (one per tile, whole batch)", counts["vae_batches"], [(3, latent[1], latent[2] // 2, latent[3] // 2)] * 4)
+    checks.expect("tiled: same storyboard", torch.allclose(tiled, expected, atol=1e-5), True)
+
+    print("Scene image cache, same scene and settings submitted twice:")
+    with tempfile.TemporaryDirectory(prefix="fairytaler_images_") as directory:
+        _image_store.directory = directory
+        _image_cache.clear()
+        settings = {name: pipeline.settings[name] for name in ("seed", "steps", "cfg", "sampler_name", "scheduler")}
+        lookup = dict(scene_text=scenes[0], model=pipeline.model, vae=pipeline.vae, width=args.size, height=args.size, debug="disable", **settings)
+        store = SceneImageCacheStore()
+        (key,) = SceneImageCacheLookup().lookup_image(**lookup)
+        checks.expect("miss: image requested", store.check_lazy_status(key), ["image"])
+        image = ThreeSceneGenerator().generate_three_scenes(scenes[0], scenes[1], scenes[2], pipeline.model, pipeline.clip, pipeline.vae,
+                                                            **pipeline.settings)[0]
+        store.store_image(key, "disable", image=image)
+        pipeline.counts()
+        _image_cache.clear()  # as after a restart: only the file on disk is left
+        (key_again,) = SceneImageCacheLookup().lookup_image(**lookup)
+        checks.expect("same key", key_again, key)
+        checks.expect("hit: image not requested", store.check_lazy_status(key), [])
+        (cached,) = store.store_image(key, "disable")
+        counts = pipeline.counts()
+        checks.expect("hit: model forward passes and VAE decodes", (len(counts["model_batches"]), len(counts["vae_batches"])), (0, 0))
+        checks.expect("hit: same 8-bit image", torch.equal((cached * 255).to(torch.uint8), (image * 255).clamp(0, 255).to(torch.uint8)), True)
+        (other,) = SceneImageCacheLookup().lookup_image(**dict(lookup, seed=settings["seed"] + 1))
+        checks.expect("other seed: image requested", store.check_lazy_status(other), ["image"])
+
+    for timings in pipeline.timings.values():
+        timings.clear()
+    start = time.perf_counter()
+    for run in range(args.runs):
+        pipeline.run(llm_output(run))
+    elapsed = time.perf_counter() - start
+    counts = pipeline.counts()
+
+    print(f"\nThroughput over {args.runs} fresh LLM outputs ({args.size}px, {args.steps} steps, {args.latency_ms:g}ms latency per call):")
+    print(f"  {args.runs / elapsed:.2f} storyboards/s, {3 * args.runs / elapsed:.2f} scenes/s")
+    for stage, timings in pipeline.timings.items():
+        print(f"  {stage:<10} {statistics.median(timings) * 1e3:8.1f} ms median")
+    print(f"  per storyboard: {counts['tokenize'] / args.runs:g} tokenize, {counts['encode_from_tokens'] / args.runs:g} encode_from_tokens, "
+          f"{len(counts['model_batches']) / args.runs:g} forward passes, {len(counts['vae_batches']) / args.runs:g} VAE decodes")
+
+    if checks.failures:
+        print(f"FAIL: {len(checks.failures)} check(s) failed: {', '.join(checks.failures)}")
+        return 1
+    print("OK: all call counts as expected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
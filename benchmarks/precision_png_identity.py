@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Storyboard output precision: saved PNGs must be byte-identical across modes
+
+Composes the same storyboards with StoryboardCompositor in every precision,
+saves each board exactly the way ComfyUI's SaveImage does (255 * image, clipped,
+for any dtype) and checks the PNG bytes match float32. Also checks save_to's
+streamed PNG decodes to the same pixels, and prints the size of each output tensor.
+
+    python benchmarks/precision_png_identity.py [--size 512] [--batch 2]
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storyboard_nodes
+from storyboard_nodes import StoryboardCompositor, _PRECISIONS
+
+
+def save_image_png(image):
+    """PNG bytes of one IMAGE the way ComfyUI's SaveImage writes it (compress_level 4), for any dtype"""
+    i = 255. * image.cpu().numpy()
+    img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", compress_level=4)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=512, help="panel width and height")
+    parser.add_argument("--batch", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    # Smooth gradients plus noise hit every 8-bit level and plenty of values near level edges
+    ramp = torch.linspace(0, 1, args.size)
+    images = [
+        (ramp[None, :, None, None] * ramp[None, None, :, None] * torch.rand(args.batch, 1, 1, 3)
+         + torch.rand(args.batch, args.size, args.size, 3) * 0.05).clamp(0, 1)
+        for _ in range(3)
+    ]
+    captions = ["A girl sits on the front steps while crows gather on the porch", "The crows scatter", ""]
+    compositor = StoryboardCompositor()
+
+    def compose(precision, **kwargs):
+        return compositor.compose_storyboard(*images, "grid", 10, "white", "enable", "disable", *captions,
+                                             precision=precision, **kwargs)[0]
+
+    reference = None
+    failed = False
+    for precision in _PRECISIONS:
+        board = compose(precision)
+        pngs = [save_image_png(item) for item in board]
+        if reference is None:
+            reference = pngs
+        identical = pngs == reference
+        failed |= not identical
+        print(f"{precision:>8}: {board.numel() * board.element_size() / 2**20:7.1f} MB tensor, "
+              f"PNG {'identical' if identical else 'DIFFERS'}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        storyboard_nodes._output_directory = lambda: directory  # save_to is relative to the output folder
+        compose("float16", save_to="board.png", tile_rows=64)
+        for i, png in enumerate(reference):
+            path = os.path.join(directory, f"board_{i + 1:05}.png" if args.batch > 1 else "board.png")
+            streamed = np.array(Image.open(path))
+            identical = np.array_equal(streamed, np.array(Image.open(io.BytesIO(png))))
+            failed |= not identical
+            print(f"streamed PNG {i + 1}: pixels {'identical' if identical else 'DIFFER'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Time to first scene: StreamingSceneParser vs parsing the finished response
+
+A fake LLM writes a storyboard response token by token at a fixed rate. The
+streaming parser emits each scene as soon as the next "Scene N:" header arrives,
+while SceneParser has to wait for the whole text.
+
+    python benchmarks/streaming_parser.py [--tokens-per-second 40]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scene_text import StreamingSceneParser
+from storyboard_nodes import SceneParser
+
+
+RESPONSE = """Constants: 1 girl around 25 years old, homeless looking, at a cabin in the woods, gloomy and country aesthetic
+
+Scene 1:
+A girl sits on the front steps of a cabin, lost in thought. A car pulls up to the cabin and parks nearby. Crows cluster around the porch and the palings, creating a sense of foreboding.
+
+Scene 2:
+The crows scatter from the sagging eaves and caw loudly at the newcomer. The girl, now alerted by the presence of the stranger, stands up and raises her head to look towards the approaching person.
+
+Scene 3:
+The girl introduces herself as "Stranger". She has a guarded expression on her face and some crows perch nearby, adding to the tension of the scene.
+"""
+
+
+def fake_llm(text, tokens_per_second):
+    """Yield text in word-sized tokens, sleeping like a local LLM would"""
+    delay = 1.0 / tokens_per_second
+    for token in re.findall(r"\s*\S+", text) + [text[len(text.rstrip()):]]:
+        time.sleep(delay)
+        yield token
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    emitted = []
+    stream = StreamingSceneParser(
+        on_scene=lambda scene_num, text: emitted.append((scene_num, time.perf_counter() - start, text))
+    )
+    for token in fake_llm(RESPONSE, args.tokens_per_second):
+        stream.feed(token)
+    _, constants, _ = stream.close()
+    stream_done = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text = "".join(fake_llm(RESPONSE, args.tokens_per_second))
+    batch = SceneParser().parse_scenes(text, "disable")
+    batch_done = time.perf_counter() - start
+
+    for scene_num, elapsed, _ in emitted:
+        print(f"streaming: scene {scene_num} ready after {elapsed:6.2f}s")
+    print(f"streaming: stream closed after {stream_done:6.2f}s")
+    print(f"batch:     all scenes ready after {batch_done:6.2f}s")
+    print(f"first scene {batch_done - emitted[0][1]:.2f}s earlier with streaming")
+
+    streamed = [text for _, _, text in sorted(emitted)]
+    if streamed != list(batch[:3]) or constants != batch[3]:
+        print("Streamed scenes differ from SceneParser output")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
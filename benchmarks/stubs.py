@@ -0,0 +1,232 @@
+"""
+Lightweight CPU stand-ins for ComfyUI's CLIP, diffusion model, VAE and sampler
+
+They follow the structure the nodes rely on: CLIP.tokenize() returns token/weight
+rows per encoder, CLIP.encode_from_tokens() goes through the text model's
+encode_token_weights(), and each encoder runs a batch of rows through encode()
+and keeps only the first row's pooled output, like ComfyUI's
+ClipTokenWeightEncoder. The diffusion model and VAE take whole latent batches and
+stub_sample() mirrors comfy.sample.sample(). Every forward pass, encode() and
+decode() call is recorded with its batch shape.
+"""
+
+import math
+import time
+import zlib
+
+import torch
+
+
+class StubTokenizer:
+    """Word-level tokenizer producing fixed-length rows like CLIP (77) and Flux's T5 (256 minimum)"""
+    def __init__(self, key, row_length, start_token=None, end_token=2, pad_token=0, vocab_size=1000):
+        self.key = key
+        self.row_length = row_length
+        self.start_token = start_token
+        self.end_token = end_token
+        self.pad_token = pad_token
+        self.vocab_size = vocab_size
+
+    def tokenize_with_weights(self, text):
+        words = [3 + zlib.crc32(word.encode()) % (self.vocab_size - 3) for word in text.split()]
+        room = self.row_length - 1 - (self.start_token is not None)
+        rows = []
+        for start in range(0, max(len(words), 1), room):
+            row = ([self.start_token] if self.start_token is not None else []) + words[start:start + room] + [self.end_token]
+            row += [self.pad_token] * (self.row_length - len(row))
+            rows.append([(token, 1.0) for token in row])
+        return rows
+
+
+class StubTextEncoder(torch.nn.Module):
+    """Small transformer encoder with ComfyUI's encode()/encode_token_weights() split"""
+    def __init__(self, width=256, layers=2, vocab_size=1000, latency=0.0):
+        super().__init__()
+        self.embedding = torch.nn.Embedding(vocab_size, width)
+        layer = torch.nn.TransformerEncoderLayer(width, nhead=4, dim_feedforward=width * 4, batch_first=True)
+        self.transformer = torch.nn.TransformerEncoder(layer, layers, enable_nested_tensor=False)
+        self.latency = latency
+        self.encode_calls = []  # batch shape of every encode() call
+
+    def encode(self, rows):
+        tokens = torch.tensor(rows, dtype=torch.long)
+        self.encode_calls.append(tuple(tokens.shape))
+        if self.latency:
+            time.sleep(self.latency)
+        with torch.no_grad():
+            z = self.transformer(self.embedding(tokens))
+        return z, z[:, 0]
+
+    def encode_token_weights(self, token_weight_pairs):
+        to_encode = []
+        max_token_len = 0
+        has_weights = False
+        for x in token_weight_pairs:
+            tokens = [a[0] for a in x]
+            max_token_len = max(len(tokens), max_token_len)
+            has_weights = has_weights or not all(a[1] == 1.0 for a in x)
+            to_encode.append(tokens)
+
+        sections = len(to_encode)
+        if has_weights or sections == 0:
+            to_encode.append([0] * max_token_len)
+
+        out, pooled = self.encode(to_encode)[:2]
+        first_pooled = pooled[0:1]
+
+        output = []
+        for k in range(sections):
+            z = out[k:k + 1]
+            if has_weights:
+                z_empty = out[-1]
+                for j in range(z.shape[1]):
+                    weight = token_weight_pairs[k][j][1]
+                    if weight != 1.0:
+                        z[0][j] = (z[0][j] - z_empty[j]) * weight + z_empty[j]
+            output.append(z)
+
+        if not output:
+            return out[-1:], first_pooled
+        return torch.cat(output, dim=-2), first_pooled
+
+
+class StubFluxTextModel(torch.nn.Module):
+    """Flux-style text model: conditioning from T5, pooled output from CLIP-L"""
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.clip_l = StubTextEncoder(width=128, layers=2, latency=latency)
+        self.t5xxl = StubTextEncoder(width=256, layers=4, latency=latency)
+
+    def encode_token_weights(self, token_weight_pairs):
+        t5_out, _ = self.t5xxl.encode_token_weights(token_weight_pairs["t5xxl"])
+        _, l_pooled = self.clip_l.encode_token_weights(token_weight_pairs["l"])
+        return t5_out, l_pooled
+
+
+class StubPatcher:
+    def __init__(self):
+        self.patches = {}
+        self.patches_uuid = 0
+
+
+class StubCLIP:
+    """Stand-in for comfy.sd.CLIP wrapping a Flux-style text model"""
+    def __init__(self, latency=0.0, seed=0):
+        torch.manual_seed(seed)
+        self.cond_stage_model = StubFluxTextModel(latency=latency).eval()
+        self.tokenizers = [StubTokenizer("l", 77, start_token=1), StubTokenizer("t5xxl", 256)]
+        self.patcher = StubPatcher()
+        self.layer_idx = None
+        self.tokenize_calls = 0
+        self.encode_from_tokens_calls = 0
+
+    def tokenize(self, text):
+        self.tokenize_calls += 1
+        return {tokenizer.key: tokenizer.tokenize_with_weights(text) for tokenizer in self.tokenizers}
+
+    def encode_from_tokens(self, tokens, return_pooled=False):
+        self.encode_from_tokens_calls += 1
+        cond, pooled = self.cond_stage_model.encode_token_weights(tokens)
+        if return_pooled:
+            return cond, pooled
+        return cond
+
+    def encoder_calls(self):
+        """Batch shapes passed to each encoder's encode(), by encoder name"""
+        return {name: list(module.encode_calls) for name, module in self.cond_stage_model.named_children()}
+
+    def reset_counts(self):
+        self.tokenize_calls = 0
+        self.encode_from_tokens_calls = 0
+        for module in self.cond_stage_model.children():
+            module.encode_calls.clear()
+
+
+def repeat_to_batch_size(tensor, batch_size):
+    """Same as comfy.utils.repeat_to_batch_size"""
+    if tensor.shape[0] > batch_size:
+        return tensor[:batch_size]
+    if tensor.shape[0] < batch_size:
+        return tensor.repeat([math.ceil(batch_size / tensor.shape[0])] + [1] * (tensor.dim() - 1))[:batch_size]
+    return tensor
+
+
+class StubLatentFormat:
+    latent_channels = 16
+
+
+class StubDiffusionModel(torch.nn.Module):
+    """Denoiser taking a latent batch and one conditioning item per latent item"""
+    def __init__(self, cond_width=256, pooled_width=128, channels=16, latency=0.0, seed=0):
+        super().__init__()
+        torch.manual_seed(seed)
+        self.latent_format = StubLatentFormat()
+        self.cond_proj = torch.nn.Linear(cond_width, channels)
+        self.pooled_proj = torch.nn.Linear(pooled_width, channels)
+        self.conv = torch.nn.Conv2d(channels, channels, 3, padding=1)
+        self.latency = latency
+        self.calls = []  # latent batch shape of every forward pass
+
+    def get_model_object(self, name):
+        return getattr(self, name)
+
+    def forward(self, x, sigma, cond, pooled):
+        self.calls.append(tuple(x.shape))
+        if self.latency:
+            time.sleep(self.latency)
+        with torch.no_grad():
+            bias = self.cond_proj(cond.mean(dim=1)) + self.pooled_proj(pooled)
+            return x - sigma * torch.tanh(self.conv(x) + bias[:, :, None, None])
+
+
+class StubVAE:
+    """Decodes a latent batch to an IMAGE batch (B, H, W, 3) in one call"""
+    downscale_ratio = 8
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.decode_calls = []
+
+    def decode(self, samples):
+        self.decode_calls.append(tuple(samples.shape))
+        if self.latency:
+            time.sleep(self.latency)
+        rgb = torch.sigmoid(samples[:, :3])
+        images = torch.nn.functional.interpolate(rgb, scale_factor=self.downscale_ratio, mode="nearest")
+        return images.movedim(1, -1)
+
+    def decode_tiled(self, samples, tile_x=64, tile_y=64, overlap=16):
+        """Same output as decode() (the stub decoder is per pixel), one decode() call per tile"""
+        images = torch.empty(samples.shape[0], samples.shape[2] * self.downscale_ratio,
+                             samples.shape[3] * self.downscale_ratio, 3)
+        ratio = self.downscale_ratio
+        for y in range(0, samples.shape[2], tile_y):
+            for x in range(0, samples.shape[3], tile_x):
+                tile = self.decode(samples[:, :, y:y + tile_y, x:x + tile_x])
+                images[:, y * ratio:y * ratio + tile.shape[1], x * ratio:x * ratio + tile.shape[2]] = tile
+        return images
+
+
+def stub_sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, seed=None):
+    """
+    Euler sampling with the same call signature as comfy.sample.sample. Conditioning
+    batches are repeated to the latent batch size like ComfyUI does, so item i of a
+    batched conditioning guides item i of the latent.
+    """
+    batch_size = latent_image.shape[0]
+
+    def unpack(conditioning):
+        cond, options = conditioning[0]
+        return repeat_to_batch_size(cond, batch_size), repeat_to_batch_size(options["pooled_output"], batch_size)
+
+    pos_cond, pos_pooled = unpack(positive)
+    neg_cond, neg_pooled = unpack(negative)
+    sigmas = torch.linspace(1.0, 0.0, steps + 1)
+    x = latent_image + noise * sigmas[0]
+    for sigma, sigma_next in zip(sigmas[:-1], sigmas[1:]):
+        denoised = model(x, sigma, pos_cond, pos_pooled)
+        if cfg != 1.0:
+            uncond = model(x, sigma, neg_cond, neg_pooled)
+            denoised = uncond + (denoised - uncond) * cfg
+        x = x + (x - denoised) / sigma * (sigma_next - sigma)
+    return x
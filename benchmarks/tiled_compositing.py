@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Peak memory of storyboard compositing: whole board tensor vs streaming to PNG
+
+Each run happens in a fresh process that creates three float32 panels, composes a
+vertical storyboard and reports how far its peak RSS rose above the RSS it had
+with just the panels loaded. The board tensor grows with the board; tiled writes
+to PNG only hold one strip of rows and should stay roughly flat.
+
+    python benchmarks/tiled_compositing.py [--sizes 512 1024 2048] [--tile-rows 256]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ["tensor", "streamed png", "streamed png + tensor"]
+
+
+def current_rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(mode, size, tile_rows):
+    import torch
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from storyboard_nodes import _peak_rss_mb, compose_storyboard, save_storyboard
+
+    images = [torch.rand(1, size, size, 3) for _ in range(3)]
+    compose_storyboard([image[:, :8, :8] for image in images], "vertical", 10, "white", "enable")  # warm up fonts
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    if mode == "tensor":
+        compose_storyboard(images, "vertical", 10, "white", "enable")
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            save_storyboard(images, os.path.join(directory, "board.png"), "vertical", 10, "white", "enable",
+                            tile_rows=tile_rows, keep=mode.endswith("tensor"))
+    elapsed = time.perf_counter() - start
+    print(f"{_peak_rss_mb() - baseline:.1f} {elapsed:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048], help="panel width and height")
+    parser.add_argument("--tile-rows", type=int, default=256)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]), args.tile_rows)
+        return 0
+
+    print(f"{'panel':>6} {'board MB (float32)':>19}" + "".join(f" {mode:>22}" for mode in MODES))
+    for size in args.sizes:
+        board_mb = size * (size * 3 + 20 + 90) * 3 * 4 / 2**20
+        cells = []
+        for mode in MODES:
+            result = subprocess.run(
+                [sys.executable, __file__, "--tile-rows", str(args.tile_rows), "--child", mode, str(size)],
+                capture_output=True, text=True, check=True
+            )
+            peak, elapsed = result.stdout.split()
+            cells.append(f"+{float(peak):7.0f} MB {float(elapsed) * 1e3:7.0f} ms")
+        print(f"{size:>6} {board_mb:>19.0f}" + "".join(f" {cell:>22}" for cell in cells))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
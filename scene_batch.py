@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Batch SceneParser for archived chats: LLM outputs in, scene prompts out as JSONL
+
+Reads JSONL (one object per line, the LLM output in --text-field) or plain text
+files (one LLM output per file), parses the scenes, extracts or applies constants
+like the SceneParser node and writes one JSON object per input record, in input
+order. Records are read lazily and handed to a process pool in chunks, with only
+a few chunks in flight, so memory stays flat no matter how large the corpus is.
+
+    python scene_batch.py chats.jsonl -o scenes.jsonl
+    python scene_batch.py outputs/*.txt --constants "1girl, red hair" --workers 8
+    cat chats.jsonl | python scene_batch.py - --chunk-size 256 > scenes.jsonl
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+
+from scene_text import apply_scene_constants, parse_scene_text
+
+
+def read_records(paths, input_format="auto", text_field="text", id_field="id"):
+    """Yield (id, text or None, error or None) for every record of every input, lazily"""
+    for path in paths:
+        is_jsonl = input_format == "jsonl" or (input_format == "auto" and (path == "-" or path.endswith((".jsonl", ".ndjson"))))
+        name = "<stdin>" if path == "-" else path
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8", errors="replace")
+        try:
+            if not is_jsonl:
+                yield name, stream.read(), None
+                continue
+            for line_number, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+                location = f"{name}:{line_number}"
+                try:
+                    record = json.loads(line)
+                    text = record[text_field] if isinstance(record, dict) else record
+                    if not isinstance(text, str):
+                        raise TypeError(f"{text_field!r} is not a string")
+                except (ValueError, KeyError, TypeError) as e:
+                    yield location, None, f"{type(e).__name__}: {e}"
+                    continue
+                record_id = record.get(id_field, location) if isinstance(record, dict) else location
+                yield record_id, text, None
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def parse_record(record_id, text, scene_constants="", constants_position="beginning", constants_format="natural", max_input_chars=100000):
+    """Output object for one LLM output, the same scenes and constants SceneParser gives"""
+    if max_input_chars and len(text) > max_input_chars:
+        text = text[:max_input_chars]
+    scenes, extracted_constants, constants_source = parse_scene_text(text)
+    constants = scene_constants.strip() if scene_constants and scene_constants.strip() else extracted_constants
+    if constants:
+        scenes = apply_scene_constants(scenes, constants, constants_position, constants_format)
+    return {
+        "id": record_id,
+        "scene_1": scenes[0],
+        "scene_2": scenes[1],
+        "scene_3": scenes[2],
+        "extracted_constants": extracted_constants,
+        "constants_source": constants_source,
+        "constants": constants,
+    }
+
+
+def parse_chunk(records, options):
+    """JSONL lines for a chunk of records (runs in a worker process)"""
+    lines = []
+    for record_id, text, error in records:
+        if error is not None:
+            result = {"id": record_id, "error": error}
+        else:
+            result = parse_record(record_id, text, **options)
+        lines.append(json.dumps(result, ensure_ascii=False) + "\n")
+    return "".join(lines)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(records, output, options, workers=None, chunk_size=64):
+    """Parse records and write the results to output in input order, returns the record count"""
+    count = 0
+    chunks = chunked(records, chunk_size)
+
+    if workers == 1:
+        for chunk in chunks:
+            output.write(parse_chunk(chunk, options))
+            count += len(chunk)
+        return count
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers) as pool:
+        in_flight = deque()
+        max_in_flight = (workers or os.cpu_count() or 1) * 2  # enough to keep every worker busy while results are written
+        for chunk in chunks:
+            if len(in_flight) >= max_in_flight:
+                output.write(in_flight.popleft().result())
+            in_flight.append(pool.submit(parse_chunk, chunk, options))
+            count += len(chunk)
+        while in_flight:
+            output.write(in_flight.popleft().result())
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="JSONL or text files, - for JSONL on stdin")
+    parser.add_argument("-o", "--output", default="-", help="output JSONL file (default: stdout)")
+    parser.add_argument("--input-format", choices=["auto", "jsonl", "text"], default="auto",
+                        help="auto treats .jsonl/.ndjson and stdin as JSONL and anything else as one LLM output per file")
+    parser.add_argument("--text-field", default="text", help="JSONL field holding the LLM output")
+    parser.add_argument("--id-field", default="id", help="JSONL field copied to the output id (default: file:line)")
+    parser.add_argument("--constants", default="", help="scene constants to apply instead of the extracted ones")
+    parser.add_argument("--constants-position", choices=["beginning", "end", "both"], default="beginning")
+    parser.add_argument("--constants-format", choices=["natural", "tags", "descriptive"], default="natural")
+    parser.add_argument("--max-input-chars", type=int, default=100000, help="only parse this many characters per output (0 = no limit)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU, 1 = no pool)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="records per task sent to a worker")
+    parser.add_argument("--stats", action="store_true", help="print record count and throughput to stderr")
+    args = parser.parse_args(argv)
+
+    options = {
+        "scene_constants": args.constants,
+        "constants_position": args.constants_position,
+        "constants_format": args.constants_format,
+        "max_input_chars": args.max_input_chars,
+    }
+    workers = args.workers or os.cpu_count() or 1
+    records = read_records(args.inputs, args.input_format, args.text_field, args.id_field)
+
+    start = time.perf_counter()
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        count = run(records, output, options, workers, max(args.chunk_size, 1))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if args.stats:
+        elapsed = time.perf_counter() - start
+        print(f"[scene_batch] {count} records in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} records/s, {workers} worker(s))",
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
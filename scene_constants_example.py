@@ -5,6 +5,9 @@ Example demonstrating the Scene Constants feature for character/setting consiste
 This shows how your specific example would work with scene constants applied.
 """
 
+from scene_text import apply_scene_constants, parse_scene_text
+
+
 def demonstrate_scene_constants():
     """Demonstrate the scene constants feature with your example"""
     
@@ -36,17 +39,8 @@ The girl introduces herself as "Stranger" and explains that she is in these part
     print("🔄 Processing with Scene Constants...")
     print("=" * 60)
     
-    # Simulate the parsing (simplified version)
-    import re
-    
-    scene_pattern = r"Scene\s*(\d+):\s*(.*?)(?=Scene\s*\d+:|$)"
-    matches = re.findall(scene_pattern, original_ollama_output, re.DOTALL | re.IGNORECASE)
-    
-    original_scenes = ["", "", ""]
-    for match in matches:
-        scene_num = int(match[0]) - 1
-        if 0 <= scene_num < 3:
-            original_scenes[scene_num] = match[1].strip()
+    # Parse the scenes the same way the SceneParser node does
+    original_scenes, _, _ = parse_scene_text(original_ollama_output)
     
     # Apply constants with different configurations
     configurations = [
@@ -60,7 +54,7 @@ The girl introduces herself as "Stranger" and explains that she is in these part
         print(f"Position: {position} | Format: {format_type}")
         print("-" * 50)
         
-        enhanced_scenes = apply_constants(original_scenes, scene_constants, position, format_type)
+        enhanced_scenes = apply_scene_constants(original_scenes, scene_constants, position, format_type)
         
         for i, scene in enumerate(enhanced_scenes):
             print(f"\n🎭 Scene {i+1} (Enhanced):")
@@ -80,39 +74,5 @@ The girl introduces herself as "Stranger" and explains that she is in these part
     print("- Format: 'natural' (for proper flow)")
     print("- Include: age, appearance, location, style/mood")
 
-def apply_constants(scenes, constants, position, format_type):
-    """Apply scene constants (mirrors the node logic)"""
-    
-    # Format the constants
-    if format_type == "tags":
-        formatted_constants = constants
-    elif format_type == "descriptive":
-        if not constants.endswith('.'):
-            formatted_constants = constants + "."
-        else:
-            formatted_constants = constants
-    else:  # natural
-        formatted_constants = constants
-        if not constants.endswith(('.', ',', ';')):
-            formatted_constants = constants + ","
-    
-    # Apply to each scene
-    enhanced_scenes = []
-    for scene in scenes:
-        if not scene:
-            enhanced_scenes.append(scene)
-            continue
-            
-        if position == "beginning":
-            enhanced_scene = f"{formatted_constants} {scene}"
-        elif position == "end":
-            enhanced_scene = f"{scene} {formatted_constants}"
-        else:  # both
-            enhanced_scene = f"{formatted_constants} {scene} {formatted_constants}"
-        
-        enhanced_scenes.append(enhanced_scene)
-    
-    return enhanced_scenes
-
 if __name__ == "__main__":
     demonstrate_scene_constants()
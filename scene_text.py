@@ -0,0 +1,449 @@
+"""
+Scene and constants parsing for FairyTaler, with no dependencies outside the
+standard library so text-only tools can use it without loading torch.
+"""
+
+import re
+
+_REGEX_FLAGS = re.DOTALL | re.IGNORECASE
+
+# Ends a constants block: blank line, next scene, next capitalised line or end of text
+_CONSTANTS_END = r"(?:\n\n|\nScene|\n[A-Z]|$)"
+
+# Patterns to look for constants in the LLM output, in priority order.
+# Each entry is (label, body); the full pattern is label + body.
+_CONSTANT_PATTERNS = [
+    # Direct patterns
+    (r"Constants?:", r"\s*(.*?)" + _CONSTANTS_END),
+    (r"Scene Constants?:", r"\s*(.*?)" + _CONSTANTS_END),
+    (r"Character Constants?:", r"\s*(.*?)" + _CONSTANTS_END),
+    (r"Setting Constants?:", r"\s*(.*?)" + _CONSTANTS_END),
+    (r"Consistent Elements?:", r"\s*(.*?)" + _CONSTANTS_END),
+    (r"Shared Details?:", r"\s*(.*?)" + _CONSTANTS_END),
+
+    # Descriptive patterns
+    (r"(?:For consistency|To maintain consistency|Consistent across all scenes?):", r"\s*(.*?)" + _CONSTANTS_END),
+    (r"(?:Character|Setting|Style) (?:description|details?):", r"\s*(.*?)" + _CONSTANTS_END),
+    (r"(?:Overall|General) (?:setting|character|aesthetic):", r"\s*(.*?)" + _CONSTANTS_END),
+
+    # Bullet point patterns
+    (r"[•\-\*]\s*(?:Character|Setting|Style|Constants?):", r"\s*(.*?)(?:\n|\n\n|$)"),
+
+    # Parenthetical patterns
+    (r"\((?:Constants?|Consistent elements?|For all scenes?):", r"\s*(.*?)\)"),
+
+    # Note patterns
+    (r"Note:", r"\s*(?:.*?(?:constant|consistent|throughout|all scenes)).*?:\s*(.*?)" + _CONSTANTS_END),
+]
+
+_CONSTANT_REGEXES = [re.compile(label + body, _REGEX_FLAGS) for label, body in _CONSTANT_PATTERNS]
+
+# Patterns that can fail after their label. Their failure at one position means
+# every later position fails too, so a pattern that failed once is dropped.
+_FALLIBLE_PATTERNS = {10, 11}
+
+# The Note pattern backtracks over every keyword when no colon follows, so it is
+# matched in steps instead: first keyword, first colon after it, then the body.
+_NOTE_PATTERN = 11
+_NOTE_KEYWORD_REGEX = re.compile(r"constant|consistent|throughout|all scenes", _REGEX_FLAGS)
+_CONSTANTS_BODY_REGEX = re.compile(r"\s*(.*?)" + _CONSTANTS_END, _REGEX_FLAGS)
+
+# Every scene header and constants label ends in a colon, and none of them is
+# longer than this apart from runs of whitespace/digits ("Scene   12:", "-   Style:")
+_MAX_LABEL_LENGTH = 40
+
+# Zero-width scanner that stops at every scene header and constants label. It is
+# only run over the few characters in front of each colon, so the text is walked
+# once instead of once per pattern. The leading class holds the first character
+# of every alternative and rejects most positions before trying them.
+_SCAN_REGEX = re.compile(
+    r"(?=[scfotgn•\-*(])(?=(?P<scene>Scene\s*(?P<num>\d+):)|"
+    + "|".join(f"(?P<c{i}>{label})" for i, (label, _) in enumerate(_CONSTANT_PATTERNS))
+    + ")",
+    _REGEX_FLAGS,
+)
+
+
+def _scan_labels(text, regex=_SCAN_REGEX, pos=0):
+    """Yield matches of regex ending at a colon, in text order"""
+    segment_start = pos
+    colon = text.find(":", pos)
+    while colon != -1:
+        start = max(segment_start, colon - _MAX_LABEL_LENGTH)
+        while start > segment_start and (text[start - 1].isspace() or text[start - 1].isdecimal()):
+            start -= 1
+        start = max(segment_start, start - len("Scene"))
+
+        yield from regex.finditer(text, start, colon + 1)
+
+        segment_start = colon + 1
+        colon = text.find(":", segment_start)
+
+
+_SCENE_HEADER_REGEX = re.compile(r"Scene\s*(\d+):", _REGEX_FLAGS)
+
+# Fallback: look for character/setting/style descriptions in the first scene.
+# Each is (lead, keyword) and stands for the pattern lead + [^.]*? + keyword,
+# i.e. a lead followed by a keyword later in the same sentence.
+_DESCRIPTIVE_PATTERNS = [
+    (re.compile(r"(?<!\d)\d+\s+(?:girl|boy|woman|man|person)", re.IGNORECASE),
+     re.compile(r"years?\s+old|looking|appearance", re.IGNORECASE)),
+    (re.compile(r"(?:at|in)\s+(?:a|the)\s+", re.IGNORECASE),
+     re.compile(r"cabin|house|building|location", re.IGNORECASE)),
+    (None,
+     re.compile(r"aesthetic|style|mood|atmosphere", re.IGNORECASE)),
+]
+
+_WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+def _clean_constants(constants):
+    constants = _WHITESPACE_REGEX.sub(" ", constants.strip())
+    return constants.rstrip(".!?")
+
+
+def _scene_number(digits):
+    # "Scene 0001:" is still scene 1, but int() refuses very long digit runs
+    digits = digits.lstrip("0")
+    return int(digits or "0") if len(digits) <= 3 else 0
+
+
+def _match_constants(index, text, pos):
+    """Match constants pattern index at pos, returning the raw constants or None"""
+    if index != _NOTE_PATTERN:
+        match = _CONSTANT_REGEXES[index].match(text, pos)
+        return match.group(1) if match else None
+
+    keyword = _NOTE_KEYWORD_REGEX.search(text, pos + len("Note:"))
+    colon = text.find(":", keyword.end()) if keyword else -1
+    if colon == -1:
+        return None
+    return _CONSTANTS_BODY_REGEX.match(text, colon + 1).group(1)
+
+
+def _find_descriptions(lead, keyword, text):
+    """
+    Same result as findall(lead + "[^.]*?" + keyword) without retrying every start
+    position. If the first lead in a sentence has no keyword after it, no later
+    lead in that sentence does either, so the search skips to the next sentence.
+    """
+    found = []
+    pos = 0
+    while pos < len(text):
+        if lead is None:
+            start = end = pos
+        else:
+            match = lead.search(text, pos)
+            if not match:
+                break
+            start, end = match.span()
+
+        sentence_end = text.find(".", end)
+        if sentence_end == -1:
+            sentence_end = len(text)
+
+        match = keyword.search(text, end, sentence_end)
+        if match:
+            found.append(text[start:match.end()])
+            pos = match.end()
+        else:
+            pos = sentence_end + 1
+
+    return found
+
+
+def parse_scene_text(text):
+    """
+    Split LLM output into 3 scenes and extract suggested constants in a single scan.
+    Every step is linear in len(text), so pathological LLM output cannot stall the queue.
+
+    Returns (scenes, constants, source) where source names the pattern the constants
+    came from, "first scene" for the descriptive fallback, or None if nothing was found.
+    """
+    headers = []  # (scene number, number text, header start, header end)
+    first_values = {}  # first match per constants pattern, cleaned
+    best = len(_CONSTANT_PATTERNS)
+    resume = len(text)
+
+    for m in _scan_labels(text):
+        if m.group("scene") is not None:
+            headers.append((_scene_number(m.group("num")), m.group("num"), m.start(), m.end("scene")))
+            continue
+
+        index = int(m.lastgroup[1:])
+        # Only the first match of each pattern counts, and nothing ranked below
+        # an already accepted pattern can win
+        if index >= best or index in first_values:
+            continue
+
+        constants = _match_constants(index, text, m.start())
+        if constants is not None:
+            constants = _clean_constants(constants)
+            first_values[index] = constants
+            if constants and len(constants) > 10:  # Ensure it's substantial
+                best = index
+        elif index in _FALLIBLE_PATTERNS:
+            first_values[index] = ""
+        else:
+            continue
+
+        # Constants are settled, the rest of the text only needs scene headers
+        if all(i in first_values for i in range(best)):
+            resume = m.start() + 1
+            break
+
+    for m in _scan_labels(text, _SCENE_HEADER_REGEX, resume):
+        headers.append((_scene_number(m.group(1)), m.group(1), m.start(), m.end()))
+
+    scenes = ["", "", ""]
+
+    # Parse scenes: each header's text runs up to the next header
+    bounds = [start for _, _, start, _ in headers[1:]] + [len(text)]
+    bodies = [text[header[3]:end].strip() for header, end in zip(headers, bounds)]
+
+    for (scene_num, _, _, _), body in zip(headers, bodies):
+        scene_num -= 1  # Convert to 0-based index
+        if 0 <= scene_num < 3:
+            scenes[scene_num] = body
+
+    # Fallback: take the first 3 scene blocks regardless of their numbers
+    if not any(scenes):
+        for i, body in enumerate(bodies[:3]):
+            scenes[i] = body
+
+    if not any(scenes):
+        paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
+        for i, paragraph in enumerate(paragraphs[:3]):
+            scenes[i] = paragraph
+
+    if best < len(_CONSTANT_PATTERNS):
+        label, body = _CONSTANT_PATTERNS[best]
+        return scenes, first_values[best], label + body
+
+    # Fallback: look for character descriptions in the first scene
+    first_scene = None
+    for i, (_, num, _, end) in enumerate(headers):
+        if num == "1":
+            next_starts = [start for _, n, start, _ in headers[i + 1:] if n == "2"]
+            first_scene = text[end:next_starts[0] if next_starts else len(text)].strip()
+            break
+
+    if first_scene:
+        potential_constants = []
+        for lead, keyword in _DESCRIPTIVE_PATTERNS:
+            potential_constants.extend(_find_descriptions(lead, keyword, first_scene))
+
+        if potential_constants:
+            return scenes, ", ".join(potential_constants[:3]), "first scene"  # Take first 3 elements
+
+    return scenes, "", None
+
+
+def apply_scene_constants(scenes, constants, position="beginning", format_type="natural"):
+    """Apply scene constants to each scene based on the specified format and position"""
+
+    if format_type == "tags":
+        formatted_constants = constants
+    elif format_type == "descriptive":
+        if not constants.endswith('.'):
+            formatted_constants = constants + "."
+        else:
+            formatted_constants = constants
+    else:
+        formatted_constants = constants
+        if not constants.endswith(('.', ',', ';')):
+            formatted_constants = constants + ","
+
+    enhanced_scenes = []
+    for scene in scenes:
+        if not scene:
+            enhanced_scenes.append(scene)
+            continue
+
+        if position == "beginning":
+            enhanced_scene = f"{formatted_constants} {scene}"
+        elif position == "end":
+            enhanced_scene = f"{scene} {formatted_constants}"
+        else:  # both
+            enhanced_scene = f"{formatted_constants} {scene} {formatted_constants}"
+
+        enhanced_scenes.append(enhanced_scene)
+
+    return enhanced_scenes
+
+
+def has_constants_block(source):
+    """Whether parse_scene_text found labelled constants rather than guessing them from the first scene"""
+    return source is not None and source != "first scene"
+
+
+def merge_scene_constants(previous, current, max_items=24):
+    """
+    Constants for a new chat turn from the ones kept for the chat so far and the ones
+    in this turn: this turn's comma separated details first, then the earlier details
+    it does not repeat, so a detail the LLM left out this time is not lost.
+    """
+    items = {}
+    for item in current.split(",") + previous.split(","):
+        item = item.strip()
+        if item:
+            items.setdefault(item.lower(), item)
+    return ", ".join(list(items.values())[:max_items])
+
+
+# Words that add little to an image prompt, the first thing dropped when a prompt has to shrink
+_FILLER_REGEX = re.compile(
+    r"\b(?:very|really|quite|rather|somewhat|just|actually|basically|simply|literally|totally|truly|"
+    r"definitely|certainly|incredibly|extremely|slightly|perhaps|maybe|seemingly|apparently|suddenly|also)\b[ \t]*",
+    re.IGNORECASE,
+)
+
+
+def _tidy(text):
+    """Clean up the spaces and separators left behind by removed words"""
+    text = re.sub(r"[ \t]+([,.;])", r"\1", text)
+    text = re.sub(r",(?:\s*,)+", ",", text)
+    text = re.sub(r"[ \t]{2,}", " ", text)
+    return text.strip().lstrip(",;").strip()
+
+
+def remove_filler_words(text):
+    """text without filler words (very, really, just, ...), and how many were removed"""
+    text, removed = _FILLER_REGEX.subn("", text)
+    return (_tidy(text) if removed else text), removed
+
+
+def trim_duplicate_constants(text, constants):
+    """
+    text with the constants only once: later copies (from the "both" position) are
+    removed, and details of the constants that the rest of the text already mentions
+    are dropped from the copy that is left. Returns the text and how many words were removed.
+    """
+    constants = constants.strip().rstrip(".,;")
+    first = text.find(constants) if constants else -1
+    if first == -1:
+        return text, 0
+
+    before, rest = text[:first], text[first + len(constants):]
+    rest, copies = re.subn(r"\s*" + re.escape(constants) + r"[.,;]?", "", rest)
+    removed = copies * len(constants.split())
+
+    others = before + " " + rest
+    kept = []
+    for item in constants.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if re.search(r"\b" + re.escape(item) + r"\b", others, re.IGNORECASE):
+            removed += len(item.split())
+        else:
+            kept.append(item)
+
+    if not removed:
+        return text, 0
+    return _tidy(before + ", ".join(kept) + rest), removed
+
+
+def pack_prompt(text, count_chunks, max_chunks=1, constants="", trim_filler=True):
+    """
+    Fit a prompt in max_chunks token chunks as measured by count_chunks(text) (e.g. the
+    number of 77 token rows a CLIP tokenizer makes). Duplicated constants and then filler
+    words are trimmed, but only if that saves a chunk; a prompt that still does not fit
+    keeps its extra chunk. Returns (text, chunks, words removed).
+    """
+    best = (text, count_chunks(text), 0)
+    if best[1] <= max_chunks:
+        return best
+
+    candidates = []
+    trimmed, removed = trim_duplicate_constants(text, constants) if constants else (text, 0)
+    if removed:
+        candidates.append((trimmed, removed))
+    if trim_filler:
+        trimmed, filler = remove_filler_words(trimmed)
+        if filler:
+            candidates.append((trimmed, removed + filler))
+
+    for candidate, words in candidates:
+        chunks = count_chunks(candidate)
+        if chunks < best[1]:
+            best = (candidate, chunks, words)
+        if chunks <= max_chunks:
+            break
+    return best
+
+
+class StreamingSceneParser:
+    """
+    Incremental parse_scene_text for LLM output that arrives in chunks.
+
+    A scene is emitted as soon as its "Scene N:" block is closed by the next header,
+    or by close() at the end of the stream, so work on scene 1 can start while the
+    LLM is still writing scenes 2 and 3. Emitted scenes have constants applied like
+    SceneParser does, using scene_constants or the constants extracted so far.
+    close() returns parse_scene_text() of the whole text, which is authoritative if
+    the LLM repeats a header or writes its constants after the scenes.
+    """
+    def __init__(self, on_scene=None, scene_constants="", constants_position="beginning", constants_format="natural"):
+        self.on_scene = on_scene
+        self.scene_constants = scene_constants.strip() if scene_constants else ""
+        self.constants_position = constants_position
+        self.constants_format = constants_format
+
+        self._text = ""
+        self._pending = []
+        self._scanned = 0  # everything before this has been searched for headers
+        self._open_header = None  # (scene number, header start, header end)
+
+    @property
+    def text(self):
+        return self._text + "".join(self._pending)
+
+    def feed(self, chunk):
+        """Add a chunk of text, returning [(scene number, scene text)] for the blocks it closed"""
+        self._pending.append(chunk)
+        # A header is only complete once its colon has arrived
+        if ":" not in chunk:
+            return []
+        return self._close_blocks()
+
+    def close(self):
+        """End the stream, emit the last open block and return parse_scene_text() of the full text"""
+        self._close_blocks()
+        if self._open_header is not None:
+            self._emit([self._open_header + (len(self._text),)])
+            self._open_header = None
+        return parse_scene_text(self._text)
+
+    def _close_blocks(self):
+        self._text += "".join(self._pending)
+        self._pending = []
+
+        closed = []
+        for m in _scan_labels(self._text, _SCENE_HEADER_REGEX, self._scanned):
+            if self._open_header is not None:
+                closed.append(self._open_header + (m.start(),))
+            self._open_header = (_scene_number(m.group(1)), m.start(), m.end())
+        self._scanned = self._text.rfind(":") + 1
+
+        return self._emit(closed)
+
+    def _emit(self, blocks):
+        emitted = []
+        for scene_num, _, body_start, body_end in blocks:
+            body = self._text[body_start:body_end].strip()
+            if body and 1 <= scene_num <= 3:
+                emitted.append((scene_num, body))
+
+        if emitted:
+            constants = self.scene_constants or parse_scene_text(self._text)[1]
+            if constants:
+                texts = apply_scene_constants([text for _, text in emitted], constants,
+                                              self.constants_position, self.constants_format)
+                emitted = [(scene_num, text) for (scene_num, _), text in zip(emitted, texts)]
+
+            if self.on_scene is not None:
+                for scene_num, text in emitted:
+                    self.on_scene(scene_num, text)
+
+        return emitted
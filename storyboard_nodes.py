@@ -1,7 +1,439 @@
+import atexit
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
 import re
-import torch
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+import struct
+import sys
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from contextlib import nullcontext
+from importlib import util as importlib_util
+
+try:
+    from .scene_text import apply_scene_constants, has_constants_block, merge_scene_constants, pack_prompt, parse_scene_text
+except ImportError:
+    from scene_text import apply_scene_constants, has_constants_block, merge_scene_constants, pack_prompt, parse_scene_text
+
+
+def _lazy_import(name):
+    """
+    Module that is only loaded on first use, so importing this file for the text
+    nodes (or from a script) does not pay for torch, numpy and PIL.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib_util.find_spec(name)
+    loader = importlib_util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib_util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+torch = _lazy_import("torch")
+np = _lazy_import("numpy")
+Image = _lazy_import("PIL.Image")
+ImageColor = _lazy_import("PIL.ImageColor")
+ImageDraw = _lazy_import("PIL.ImageDraw")
+ImageFont = _lazy_import("PIL.ImageFont")
+
+
+logger = logging.getLogger("FairyTaler")
+
+
+def _loaded(module):
+    """Whether a _lazy_import module has actually been imported yet"""
+    return type(module).__name__ != "_LazyModule"
+
+
+class _NullTrace:
+    """Trace for node runs nobody is watching: every method is a no-op"""
+    debug = False
+    _stage = nullcontext()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def stage(self, name):
+        return self._stage
+
+    def log(self, message, *args):
+        pass
+
+    def note(self, **fields):
+        pass
+
+
+_NULL_TRACE = _NullTrace()
+
+
+class _Stage:
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        stages = self.trace.stages
+        stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+class _Trace:
+    """
+    Wall time per stage, input sizes and memory of one node run. Exiting the
+    trace emits them as a single record on the FairyTaler logger (INFO with debug
+    enabled, DEBUG otherwise; the dict is in the record's fairytaler_metrics
+    attribute) and appends it to the FAIRYTALER_METRICS JSON lines file if set.
+    Stages that run several times (e.g. once per strip) add up.
+
+    Memory is the resident set size at the start and end of the run and, on CUDA,
+    the allocated bytes at both ends. The CUDA peak counters are process wide and are
+    not reset (other code may rely on them), so cuda_peak_allocated_bytes is only
+    reported when this run set a new peak, which then is this run's peak.
+    """
+    def __init__(self, node, debug, metrics_path=None):
+        self.node = node
+        self.debug = debug
+        self.metrics_path = metrics_path
+        self.stages = {}
+        self.fields = {}
+
+    def __enter__(self):
+        self.cuda = _loaded(torch) and torch.cuda.is_available() and torch.cuda.is_initialized()
+        if self.cuda:
+            self.cuda_start = (torch.cuda.memory_allocated(), torch.cuda.max_memory_allocated())
+        self.rss_start = _rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record = {
+            "node": self.node,
+            "time": time.time(),
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            **self.fields,
+            "rss_start_mb": self.rss_start,
+            "rss_end_mb": _rss_mb(),
+        }
+        if self.cuda:
+            record["cuda_allocated_start_bytes"] = self.cuda_start[0]
+            record["cuda_allocated_end_bytes"] = torch.cuda.memory_allocated()
+            peak = torch.cuda.max_memory_allocated()
+            if peak > self.cuda_start[1]:
+                record["cuda_peak_allocated_bytes"] = peak
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc_value}"
+
+        stages = ", ".join(f"{name} {ms:.1f} ms" for name, ms in record["stages_ms"].items())
+        self.log("%.1f ms (%s)", record["total_ms"], stages or "no stages", level=logging.INFO if self.debug else logging.DEBUG,
+                 extra={"fairytaler_metrics": record})
+
+        if self.metrics_path:
+            line = json.dumps(record, default=str) + "\n"
+            with _metrics_lock, open(self.metrics_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        return False
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def log(self, message, *args, level=logging.INFO, extra=None):
+        """Debug output for this node, printed when nothing is set up to handle the FairyTaler logger"""
+        if level == logging.INFO and not self.debug:
+            return
+        if logger.hasHandlers():
+            logger.log(level, "[%s] " + message, self.node, *args, extra=extra)
+        elif level >= logging.INFO:
+            print(f"[{self.node}] " + (message % args if args else message))
+
+    def note(self, **fields):
+        """Record input/output sizes and other facts about this run"""
+        self.fields.update(fields)
+
+
+# JSON lines file that gets one metrics record per node run, read once at startup
+_metrics_path = os.environ.get("FAIRYTALER_METRICS") or None
+_metrics_lock = threading.Lock()
+
+
+def _trace(node, debug):
+    """
+    Trace for one run of node. Only a real trace when debug is enabled, metrics
+    go to a FAIRYTALER_METRICS file or the FairyTaler logger is at DEBUG level;
+    otherwise the shared no-op trace.
+    """
+    if debug == "enable" or _metrics_path or logger.isEnabledFor(logging.DEBUG):
+        return _Trace(node, debug == "enable", _metrics_path)
+    return _NULL_TRACE
+
+
+def _cap_input(text, max_chars, trace):
+    """Only parse the first max_chars characters of text (0 disables the cap)"""
+    if max_chars and len(text) > max_chars:
+        trace.log("Input has %d characters, parsing only the first %d", len(text), max_chars)
+        return text[:max_chars]
+    return text
+
+
+def _log_constants_source(trace, constants, source):
+    if source == "first scene":
+        trace.log("Fallback extraction from first scene: %s", constants)
+    elif source:
+        trace.log("Found constants with pattern: %s...", source[:50])
+        trace.log("Extracted: %s", constants)
+
+    if constants:
+        trace.log("Successfully extracted constants: %s", constants)
+    else:
+        trace.log("No constants found in LLM output")
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache that counts its hits and misses.
+    With max_bytes set, sizeof(value) is also kept under that total. With ttl set,
+    entries expire ttl seconds after they were last put.
+    """
+    def __init__(self, max_entries, max_bytes=None, sizeof=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (value, size, expiry time or None)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                del self._entries[key]
+                self.bytes -= entry[1]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size, time.monotonic() + self.ttl if self.ttl is not None else None)
+            self.bytes += size
+            self._evict()
+
+    def resize(self, max_entries=None, max_bytes=None, ttl=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if ttl is not None:
+                self.ttl = ttl
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self.bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        stats = f"{self.hits} hits, {self.misses} misses, {len(self._entries)}/{self.max_entries} entries"
+        if self.max_bytes is not None:
+            stats += f", {self.bytes / 2**20:.1f}/{self.max_bytes / 2**20:.0f} MB"
+        return stats
+
+    __str__ = stats  # so log messages only build the stats when they are emitted
+
+
+class DiskStore:
+    """
+    Directory of cache files named by key. Files are written to a temporary name and
+    renamed into place, so concurrent readers never see partial files, and the least
+    recently used files are deleted once the directory grows past max_bytes.
+    """
+    def __init__(self, directory, suffix, max_bytes):
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def load(self, key, reader):
+        """Return reader(path) for the file stored under key, or None"""
+        path = self.path(key)
+        try:
+            value = reader(path)
+            os.utime(path)  # mark as recently used
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Removing unreadable cache file %s: %s", path, e)
+            self._remove(path)
+            return None
+
+    def save(self, key, writer):
+        """Store a file under key by calling writer(path) on a temporary path"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, self.path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self.trim()
+
+    def trim(self):
+        files = []
+        total = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.suffix):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _hash_inputs(*values):
+    """Content hash of values, used as cache key"""
+    digest = hashlib.sha256()
+    for value in values:
+        data = str(value).encode("utf-8", "surrogatepass")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+# Parsed scenes and extracted constants shared by SceneParser and FairyTalerStoryboard,
+# keyed by the hash of the text and the input cap
+_parse_cache = LRUCache(64)
+
+# Constants per chat session id, expiring after a session has been idle for the TTL
+_session_constants = LRUCache(256, ttl=120 * 60)
+
+
+def _session_scene_constants(trace, session_id, extracted_constants, constants_source, session_merge):
+    """
+    Constants for this turn of a chat session. A turn with a constants block updates the
+    session's constants (merged with the earlier ones or replacing them); a turn without
+    one reuses them, so the prompts stay the same when the LLM leaves the block out.
+    """
+    previous = _session_constants.get(session_id)
+    if has_constants_block(constants_source):
+        merge = previous and session_merge == "merge"
+        constants = merge_scene_constants(previous, extracted_constants) if merge else extracted_constants
+        trace.log("Session %s: %s this turn's constants", session_id, "merged in" if merge else "stored")
+        trace.note(session="updated")
+    elif previous:
+        constants = previous
+        trace.log("Session %s: no constants block, reusing the session's constants", session_id)
+        trace.note(session="reused")
+    else:
+        # Nothing to reuse; a guess from the first scene is used but not kept for later turns
+        trace.note(session="new")
+        return extracted_constants
+
+    _session_constants.put(session_id, constants)  # also restarts the session's TTL
+    return constants
+
+
+def _parse_with_constants(trace, ollama_text, scene_constants, constants_position, constants_format, max_input_chars, session_id="", session_merge="merge"):
+    """Parse scenes and apply constants for the text nodes, reusing earlier parses of identical text"""
+    trace.note(input_chars=len(ollama_text))
+    key = _hash_inputs(ollama_text, max_input_chars)
+    parsed = _parse_cache.get(key)
+    if parsed is not None:
+        trace.note(parse_cache="hit")
+        trace.log("Parse cache hit (%s)", _parse_cache)
+    else:
+        # Scene splitting and constants extraction happen in the same scan
+        with trace.stage("parse"):
+            parsed = parse_scene_text(_cap_input(ollama_text, max_input_chars, trace))
+        _parse_cache.put(key, parsed)
+        trace.note(parse_cache="miss")
+        trace.log("Parse cache miss (%s)", _parse_cache)
+        _log_constants_source(trace, parsed[1], parsed[2])
+
+    scenes, extracted_constants, constants_source = parsed
+
+    if scene_constants and scene_constants.strip():
+        final_constants = scene_constants.strip()
+    elif session_id and session_id.strip():
+        final_constants = _session_scene_constants(trace, session_id.strip(), extracted_constants, constants_source, session_merge)
+    else:
+        final_constants = extracted_constants
+
+    if final_constants and constants_position != "none":
+        trace.log("Applying constants in %s format at %s", constants_format, constants_position)
+        with trace.stage("constants"):
+            scenes = apply_scene_constants(scenes, final_constants, constants_position, constants_format)
+
+    trace.log("Extracted constants: %s", extracted_constants)
+    trace.log("Final constants used: %s", final_constants)
+    trace.log("Final scenes with constants applied:")
+    for i, scene in enumerate(scenes):
+        trace.log("Scene %d: %s...", i + 1, scene[:100])
+    trace.note(constants_chars=len(final_constants))
+
+    return tuple(scenes), extracted_constants, final_constants
 
 
 class SceneParser:
@@ -27,179 +459,364 @@ class SceneParser:
                     "default": "",
                     "placeholder": "e.g., 1kombat wombat, super ninja skillz, sick and xtreme asthetic"
                 }),
-                "constants_position": (["beginning", "end", "both"],),
+                "constants_position": (["beginning", "end", "both", "none"],),
                 "constants_format": (["natural", "tags", "descriptive"],),
+                "max_input_chars": ("INT", {
+                    "default": 100000,
+                    "min": 0,
+                    "max": 10000000,
+                    "step": 1000
+                }),
+                "session_id": ("STRING", {
+                    "default": "",
+                    "placeholder": "e.g. the chat name, keeps constants across turns"
+                }),
+                "session_merge": (["merge", "replace"],),
+                "session_ttl_minutes": ("INT", {
+                    "default": 120,
+                    "min": 1,
+                    "max": 10080,
+                    "step": 10
+                }),
             },
         }
 
-    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING")
-    RETURN_NAMES = ("scene_1", "scene_2", "scene_3", "extracted_constants")
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("scene_1", "scene_2", "scene_3", "extracted_constants", "constants")
     FUNCTION = "parse_scenes"
     CATEGORY = "FairyTaler/Storyboard"
 
-    def parse_scenes(self, ollama_text, debug, scene_constants="", constants_position="beginning", constants_format="natural"):
-        if debug == "enable":
-            print(f"[SceneParser] Input text:\n{ollama_text}")
+    def parse_scenes(self, ollama_text, debug, scene_constants="", constants_position="beginning", constants_format="natural", max_input_chars=100000, session_id="", session_merge="merge", session_ttl_minutes=120):
+        _session_constants.resize(ttl=session_ttl_minutes * 60)
+        with _trace("SceneParser", debug) as trace:
+            trace.log("Input text:\n%s", ollama_text)
             if scene_constants:
-                print(f"[SceneParser] Scene constants: {scene_constants}")
-                print(f"[SceneParser] Constants position: {constants_position}")
-                print(f"[SceneParser] Constants format: {constants_format}")
+                trace.log("Scene constants: %s", scene_constants)
+                trace.log("Constants position: %s", constants_position)
+                trace.log("Constants format: %s", constants_format)
 
-        # Parse scenes using regex to find Scene 1:, Scene 2:, Scene 3: patterns
-        scene_pattern = r"Scene\s*(\d+):\s*(.*?)(?=Scene\s*\d+:|$)"
-        matches = re.findall(scene_pattern, ollama_text, re.DOTALL | re.IGNORECASE)
+            scenes, extracted_constants, constants = _parse_with_constants(
+                trace, ollama_text, scene_constants, constants_position, constants_format, max_input_chars, session_id, session_merge
+            )
 
-        scenes = ["", "", ""]
+        return (scenes[0], scenes[1], scenes[2], extracted_constants, constants)
 
-        for match in matches:
-            scene_num = int(match[0]) - 1  # Convert to 0-based index
-            if 0 <= scene_num < 3:
-                scenes[scene_num] = match[1].strip()
 
-        if not any(scenes):
-            parts = re.split(r'Scene\s*\d+:', ollama_text, flags=re.IGNORECASE)
-            if len(parts) > 1:
-                for i, part in enumerate(parts[1:4]):  # Take up to 3 scenes
-                    if i < 3:
-                        scenes[i] = part.strip()
+def _hash_value(digest, value, depth=0):
+    """
+    Feed a description of value into digest. Tensors are sampled, not hashed whole:
+    their shape, dtype, first and last 16 values and 64 values spread evenly between,
+    so two tensors that only differ elsewhere get the same hash. That catches other
+    checkpoints, fine-tunes and merged LoRAs, which change nearly every value, while
+    keeping a multi-GB model fingerprint to milliseconds. Functions are described by
+    their qualified name and what they close over, objects by their attributes.
+    """
+    if isinstance(value, torch.Tensor):
+        digest.update(f"tensor{tuple(value.shape)}{value.dtype}".encode())
+        try:
+            flat = value.detach().reshape(-1)
+            spread = flat[::max(flat.numel() // 64, 1)][:64]
+            sample = torch.cat([flat[:16], spread, flat[-16:]]).to("cpu", torch.float32)
+            digest.update(sample.numpy().tobytes())
+        except Exception:
+            pass  # quantized or offloaded weights, shape and dtype will have to do
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            digest.update(str(key).encode("utf-8", "surrogatepass"))
+            _hash_value(digest, value[key], depth)
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _hash_value(digest, item, depth)
+    elif hasattr(value, "__code__"):
+        # Functions and lambdas (e.g. CFG and attention patches): the name and the settings captured in the closure
+        digest.update(f"{value.__module__}.{value.__qualname__}".encode())
+        if depth < 4:
+            cells = []
+            for cell in value.__closure__ or ():
+                try:
+                    cells.append(cell.cell_contents)
+                except ValueError:
+                    cells.append(None)  # not assigned yet
+            _hash_value(digest, (value.__defaults__, cells), depth + 1)
+    elif hasattr(value, "__func__") and hasattr(value, "__self__"):
+        # Bound methods: the function and the object it is bound to
+        _hash_value(digest, value.__func__, depth)
+        _hash_value(digest, value.__self__, depth + 1)
+    elif isinstance(value, functools.partial):
+        _hash_value(digest, (value.func, value.args, value.keywords), depth + 1)
+    elif hasattr(value, "__dict__") and depth < 4:
+        # Weight adapters and similar objects, whose repr would include their address
+        digest.update(type(value).__qualname__.encode())
+        _hash_value(digest, vars(value), depth + 1)
+    else:
+        digest.update(repr(value).encode("utf-8", "surrogatepass"))
+
+
+# Model object -> ((patches uuid, settings), fingerprint)
+_fingerprints = weakref.WeakKeyDictionary()
+
+
+def _weights_fingerprint(owner, module, patcher=None, settings=None):
+    """
+    Identify a model by its weights, patches (LoRAs) and settings that change its output
+    (e.g. clip skip), so the same model loaded again after a restart gets the same fingerprint.
+    owner is what the fingerprint is remembered for until its patches change.
+    """
+    state = (getattr(patcher, "patches_uuid", None), settings)
+    try:
+        cached = _fingerprints.get(owner)
+    except TypeError:
+        cached = None
+    if cached is not None and cached[0] == state:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    digest.update(type(module).__qualname__.encode())
+    _hash_value(digest, settings)
+    if isinstance(module, torch.nn.Module):
+        for name, tensor in module.state_dict().items():
+            digest.update(name.encode())
+            _hash_value(digest, tensor)
+    _hash_value(digest, getattr(patcher, "patches", None))
+    fingerprint = digest.hexdigest()
+
+    try:
+        _fingerprints[owner] = (state, fingerprint)
+    except TypeError:
+        pass  # not weak-referenceable, fingerprint again next time
+    return fingerprint
+
+
+def _clip_fingerprint(clip):
+    """CLIP model fingerprint: text encoder weights, LoRAs and clip skip layer"""
+    return _weights_fingerprint(clip, getattr(clip, "cond_stage_model", clip), getattr(clip, "patcher", None),
+                                getattr(clip, "layer_idx", None))
+
+
+def _model_fingerprint(model):
+    """
+    Diffusion model (ModelPatcher) fingerprint: weights and LoRAs, plus the object patches
+    (e.g. ModelSamplingFlux/SD3's shift), model options (CFG and attention patches) and the
+    model's own sampling parameters, which change the image without touching the weights.
+    """
+    module = getattr(model, "model", model)
+    digest = hashlib.sha256(_weights_fingerprint(model, module, model if hasattr(model, "patches") else None).encode())
+    _hash_value(digest, getattr(model, "object_patches", None))
+    _hash_value(digest, getattr(model, "model_options", None))
+    _hash_value(digest, getattr(module, "model_sampling", None))
+    return digest.hexdigest()
 
-        if not any(scenes):
-            paragraphs = [p.strip() for p in ollama_text.split('\n\n') if p.strip()]
-            for i, paragraph in enumerate(paragraphs[:3]):
-                scenes[i] = paragraph
 
-        # Extract constants from LLM output
-        extracted_constants = self._extract_constants_from_text(ollama_text, debug)
+def _vae_fingerprint(vae):
+    """VAE fingerprint: decoder weights"""
+    return _weights_fingerprint(vae, getattr(vae, "first_stage_model", vae))
 
-        final_constants = scene_constants.strip() if scene_constants and scene_constants.strip() else extracted_constants
 
-        if final_constants:
-            scenes = self._apply_scene_constants(scenes, final_constants, constants_position, constants_format, debug)
+def _conditioning_size(entry):
+    return sum(t.numel() * t.element_size() for t in entry if t is not None)
 
-        if debug == "enable":
-            print(f"[SceneParser] Extracted constants: {extracted_constants}")
-            print(f"[SceneParser] Final constants used: {final_constants}")
-            print(f"[SceneParser] Final scenes with constants applied:")
-            for i, scene in enumerate(scenes):
-                print(f"Scene {i+1}: {scene[:150]}...")
 
-        return (scenes[0], scenes[1], scenes[2], extracted_constants)
+# (cond, pooled) per CLIP fingerprint and scene text
+_conditioning_cache = LRUCache(1024, max_bytes=512 * 2**20, sizeof=_conditioning_size)
+_conditioning_store = DiskStore(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "conditioning"), ".safetensors", 2 * 2**30
+)
 
-    def _apply_scene_constants(self, scenes, constants, position, format_type, debug):
-        """Apply scene constants to each scene based on the specified format and position"""
 
-        if debug == "enable":
-            print(f"[SceneParser] Applying constants in {format_type} format at {position}")
+def _load_conditioning(path):
+    from safetensors.torch import load_file
+    tensors = load_file(path)
+    return tensors["cond"], tensors.get("pooled")
 
-        if format_type == "tags":
-            formatted_constants = constants
-        elif format_type == "descriptive":
-            if not constants.endswith('.'):
-                formatted_constants = constants + "."
-            else:
-                formatted_constants = constants
+
+def _row_encoders(clip):
+    """Text encoder modules that run a batch of token rows through encode()"""
+    model = getattr(clip, "cond_stage_model", None)
+    if not isinstance(model, torch.nn.Module):
+        return []
+    return [m for m in model.modules() if callable(getattr(m, "encode", None)) and hasattr(m, "encode_token_weights")]
+
+
+def _can_batch(token_sets):
+    """Rows can share a batch when every encoder's rows already have the same length"""
+    if not all(isinstance(tokens, dict) for tokens in token_sets):
+        return False
+    keys = set(token_sets[0])
+    if any(set(tokens) != keys for tokens in token_sets):
+        return False
+    for key in keys:
+        if len({len(row) for tokens in token_sets for row in tokens[key]}) != 1:
+            return False
+    return True
+
+
+def _take_rows(value, index, batch_size):
+    if isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == batch_size:
+        return value[index]
+    if isinstance(value, dict):
+        return {k: _take_rows(v, index, batch_size) for k, v in value.items()}
+    return value
+
+
+def _encode_batch(clip, texts, trace=_NULL_TRACE):
+    """
+    Encode several texts with one forward pass per text encoder.
+
+    The token rows of all texts go through clip.encode_from_tokens() together while
+    each encoder's batch output is recorded. Each text is then encoded on its own
+    with the encoders replaying its recorded rows, so ComfyUI still does the token
+    weighting and combines the encoders exactly as for a single prompt. Falls back to
+    one encode per text when rows would need padding or the encoder cannot batch.
+
+    Returns ([(cond, pooled)], whether the batched path was used).
+    """
+    with trace.stage("tokenize"):
+        token_sets = [clip.tokenize(text) for text in texts]
+    encoders = _row_encoders(clip)
+    if len(texts) < 2 or not encoders or not _can_batch(token_sets):
+        with trace.stage("encode"):
+            return [clip.encode_from_tokens(tokens, return_pooled=True) for tokens in token_sets], False
+
+    recorded = {}  # encoder -> (row index by tokens, encoder output, batch size)
+
+    def record(encoder, encode):
+        def wrapper(rows, *args, **kwargs):
+            output = encode(rows, *args, **kwargs)
+            recorded[encoder] = ({tuple(row): i for i, row in enumerate(rows)}, output, len(rows))
+            return output
+        return wrapper
+
+    def replay(encoder, encode):
+        def wrapper(rows, *args, **kwargs):
+            if encoder in recorded:
+                index, output, batch_size = recorded[encoder]
+                try:
+                    rows_index = [index[tuple(row)] for row in rows]
+                except (KeyError, TypeError):
+                    return encode(rows, *args, **kwargs)
+                return type(output)(_take_rows(value, rows_index, batch_size) for value in output)
+            return encode(rows, *args, **kwargs)
+        return wrapper
+
+    def encode_with(hook, tokens):
+        originals = [(encoder, encoder.__dict__.get("encode")) for encoder in encoders]
+        for encoder in encoders:
+            encoder.encode = hook(encoder, encoder.encode)
+        try:
+            return clip.encode_from_tokens(tokens, return_pooled=True)
+        finally:
+            for encoder, original in originals:
+                if original is None:
+                    del encoder.encode
+                else:
+                    encoder.encode = original
+
+    merged = {key: [row for tokens in token_sets for row in tokens[key]] for key in token_sets[0]}
+    with trace.stage("encode"):
+        try:
+            encode_with(record, merged)
+            return [encode_with(replay, tokens) for tokens in token_sets], True
+        except Exception as e:
+            logger.warning("Batched text encoding failed, encoding one text at a time: %s", e)
+            return [clip.encode_from_tokens(tokens, return_pooled=True) for tokens in token_sets], False
+
+
+def _encode_texts(clip, texts, trace=_NULL_TRACE, use_cache=True, persist=False, batch=True):
+    """
+    Encode texts with clip, reusing conditioning for text this CLIP model has encoded
+    before and batching the rest. Returns one (cond, pooled) per text.
+    """
+    keys = {}
+    entries = {}
+    fingerprint = _clip_fingerprint(clip) if use_cache else None
+
+    for text in dict.fromkeys(texts):
+        if not use_cache:
+            continue
+        key = keys[text] = _hash_inputs(fingerprint, text)
+        entry = _conditioning_cache.get(key)
+        if entry is None and persist:
+            entry = _conditioning_store.load(key, _load_conditioning)
+            if entry is not None:
+                _conditioning_cache.put(key, entry)
+        if entry is not None:
+            entries[text] = entry
+
+    missing = [text for text in dict.fromkeys(texts) if text not in entries]
+    if missing:
+        if batch:
+            encoded, batched = _encode_batch(clip, missing, trace)
         else:
-            formatted_constants = constants
-            if not constants.endswith(('.', ',', ';')):
-                formatted_constants = constants + ","
-
-        enhanced_scenes = []
-        for i, scene in enumerate(scenes):
-            if not scene:
-                enhanced_scenes.append(scene)
+            with trace.stage("tokenize"):
+                token_sets = [clip.tokenize(text) for text in missing]
+            with trace.stage("encode"):
+                encoded = [clip.encode_from_tokens(tokens, return_pooled=True) for tokens in token_sets]
+            batched = False
+
+        for text, entry in zip(missing, encoded):
+            entries[text] = entry
+            if not use_cache:
                 continue
+            _conditioning_cache.put(keys[text], entry)
+            if persist:
+                _save_conditioning(keys[text], entry)
 
-            if position == "beginning":
-                enhanced_scene = f"{formatted_constants} {scene}"
-            elif position == "end":
-                enhanced_scene = f"{scene} {formatted_constants}"
-            else:  # both
-                enhanced_scene = f"{formatted_constants} {scene} {formatted_constants}"
-
-            enhanced_scenes.append(enhanced_scene)
-
-            if debug == "enable":
-                print(f"[SceneParser] Enhanced scene {i+1}: {enhanced_scene[:100]}...")
-
-        return enhanced_scenes
-
-    def _extract_constants_from_text(self, text, debug):
-        """Extract suggested constants from LLM output using various patterns"""
-
-        if debug == "enable":
-            print(f"[SceneParser] Extracting constants from LLM text...")
-
-        # Patterns to look for constants in the LLM output
-        constant_patterns = [
-            # Direct patterns
-            r"Constants?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Scene Constants?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Character Constants?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Setting Constants?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Consistent Elements?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Shared Details?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-
-            # Descriptive patterns
-            r"(?:For consistency|To maintain consistency|Consistent across all scenes?):\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"(?:Character|Setting|Style) (?:description|details?):\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"(?:Overall|General) (?:setting|character|aesthetic):\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-
-            # Bullet point patterns
-            r"[•\-\*]\s*(?:Character|Setting|Style|Constants?):\s*(.*?)(?:\n|\n\n|$)",
-
-            # Parenthetical patterns
-            r"\((?:Constants?|Consistent elements?|For all scenes?):\s*(.*?)\)",
-
-            # Note patterns
-            r"Note:\s*(?:.*?(?:constant|consistent|throughout|all scenes)).*?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-        ]
-
-        extracted_constants = ""
-
-        for pattern in constant_patterns:
-            matches = re.findall(pattern, text, re.DOTALL | re.IGNORECASE)
-            if matches:
-                # Take the first match and clean it up
-                constants = matches[0].strip()
-                constants = re.sub(r'\s+', ' ', constants)
-                constants = re.sub(r'[.!?]+$', '', constants)
-
-                if constants and len(constants) > 10:
-                    extracted_constants = constants
-                    if debug == "enable":
-                        print(f"[SceneParser] Found constants with pattern: {pattern[:50]}...")
-                        print(f"[SceneParser] Extracted: {constants}")
-                    break
-
-        if not extracted_constants:
-            scene_pattern = r"Scene\s*1:\s*(.*?)(?=Scene\s*2:|$)"
-            scene_match = re.search(scene_pattern, text, re.DOTALL | re.IGNORECASE)
-
-            if scene_match:
-                first_scene = scene_match.group(1).strip()
-                descriptive_patterns = [
-                    r"(\d+\s+(?:girl|boy|woman|man|person)[^.]*?(?:years?\s+old|looking|appearance)[^.]*?)",
-                    r"((?:at|in)\s+(?:a|the)\s+[^.]*?(?:cabin|house|building|location)[^.]*?)",
-                    r"([^.]*?(?:aesthetic|style|mood|atmosphere)[^.]*?)",
-                ]
-
-                potential_constants = []
-                for pattern in descriptive_patterns:
-                    matches = re.findall(pattern, first_scene, re.IGNORECASE)
-                    potential_constants.extend(matches)
-
-                if potential_constants:
-                    extracted_constants = ", ".join(potential_constants[:3])
-                    if debug == "enable":
-                        print(f"[SceneParser] Fallback extraction from first scene: {extracted_constants}")
-
-        if debug == "enable":
-            if extracted_constants:
-                print(f"[SceneParser] Successfully extracted constants: {extracted_constants}")
-            else:
-                print(f"[SceneParser] No constants found in LLM output")
+        trace.log("Encoded %d text(s) %s", len(missing), "in one batch" if batched else "one at a time")
 
-        return extracted_constants
+    trace.note(texts=len(texts), encoded=len(missing))
+    if use_cache:
+        trace.log("Conditioning cache: %d of %d cached, %s", len(texts) - len(missing), len(texts), _conditioning_cache)
+
+    return [entries[text] for text in texts]
+
+
+def _save_conditioning(key, entry):
+    from safetensors.torch import save_file
+    tensors = {"cond": entry[0].detach().to("cpu").contiguous()}
+    if entry[1] is not None:
+        tensors["pooled"] = entry[1].detach().to("cpu").contiguous()
+    _conditioning_store.save(key, lambda path: save_file(tensors, path))
+
+
+_CONSTANTS_MODES = ["concat", "blend"]
+
+
+def _combine_constants(encoded, constants, mode, weight):
+    """
+    Combine each scene's (cond, pooled) with the (cond, pooled) of the separately encoded
+    constants. concat appends the constants tokens and keeps the scene's pooled output,
+    like ConditioningConcat. blend mixes weight of the constants into the scene, like
+    ConditioningAverage, with the constants cut or zero-padded to the scene's length.
+    """
+    constants_cond, constants_pooled = constants
+    combined = []
+    for cond, pooled in encoded:
+        other = constants_cond.to(cond)
+        if mode == "concat":
+            cond = torch.cat([cond, other], dim=1)
+        else:
+            other = other[:, :cond.shape[1]]
+            if other.shape[1] < cond.shape[1]:
+                other = torch.cat([other, other.new_zeros((1, cond.shape[1] - other.shape[1], other.shape[2]))], dim=1)
+            cond = cond * (1.0 - weight) + other * weight
+            if pooled is not None and constants_pooled is not None:
+                pooled = pooled * (1.0 - weight) + constants_pooled.to(pooled) * weight
+        combined.append((cond, pooled))
+    return combined
+
+
+def _encode_with_constants(clip, texts, constants, mode, weight, trace=_NULL_TRACE, **options):
+    """
+    _encode_texts for texts plus constants that are encoded once, in the same batch, and
+    combined with every text's conditioning. The constants' encoding is cached like any
+    other text, so later runs with the same constants reuse it.
+    """
+    if not constants or not constants.strip():
+        return _encode_texts(clip, texts, trace, **options)
+    encoded = _encode_texts(clip, texts + [constants.strip()], trace, **options)
+    trace.log("Combining constants with each scene by %s", mode)
+    return _combine_constants(encoded[:-1], encoded[-1], mode, weight)
 
 
 class SceneToConditioning:
@@ -220,6 +837,28 @@ class SceneToConditioning:
                 "clip": ("CLIP",),
                 "debug": (["enable", "disable"],),
             },
+            "optional": {
+                "cache": (["enable", "disable"],),
+                "cache_size_mb": ("INT", {
+                    "default": 512,
+                    "min": 16,
+                    "max": 65536,
+                    "step": 16
+                }),
+                "persist_cache": (["disable", "enable"],),
+                "constants": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "placeholder": "Constants to encode once and combine with the scene conditioning (e.g. SceneParser's constants output with constants_position none)"
+                }),
+                "constants_mode": (_CONSTANTS_MODES,),
+                "constants_weight": ("FLOAT", {
+                    "default": 0.3,
+                    "min": 0.0,
+                    "max": 1.0,
+                    "step": 0.05
+                }),
+            },
         }
 
     RETURN_TYPES = ("CONDITIONING",)
@@ -227,23 +866,206 @@ class SceneToConditioning:
     FUNCTION = "encode_scene"
     CATEGORY = "FairyTaler/Storyboard"
 
-    def encode_scene(self, scene_text, clip, debug):
-        if debug == "enable":
-            print(f"[SceneToConditioning] Encoding scene: {scene_text[:100]}...")
+    def encode_scene(self, scene_text, clip, debug, cache="enable", cache_size_mb=512, persist_cache="disable", constants="", constants_mode="concat", constants_weight=0.3):
+        with _trace("SceneToConditioning", debug) as trace:
+            trace.log("Encoding scene: %s...", scene_text[:100])
+            trace.note(input_chars=len(scene_text))
 
-        # Encode the text using CLIP
-        tokens = clip.tokenize(scene_text)
-        cond, pooled = clip.encode_from_tokens(tokens, return_pooled=True)
+            _conditioning_cache.resize(max_bytes=cache_size_mb * 2**20)
 
-        # Create conditioning object in ComfyUI format
-        conditioning = [[cond, {"pooled_output": pooled}]]
+            # Encode the text using CLIP
+            cond, pooled = _encode_with_constants(clip, [scene_text], constants, constants_mode, constants_weight, trace,
+                                                  use_cache=cache == "enable", persist=persist_cache == "enable")[0]
 
-        if debug == "enable":
-            print(f"[SceneToConditioning] Created conditioning with shape: {cond.shape}")
+            # Create conditioning object in ComfyUI format
+            conditioning = [[cond, {"pooled_output": pooled}]]
+
+            trace.log("Created conditioning with shape: %s", cond.shape)
+            trace.note(conditioning_shape=list(cond.shape))
 
         return (conditioning,)
 
 
+def _token_chunks(clip, text):
+    """Token chunks (e.g. CLIP's 77 token rows) the text takes up, the most of any of the CLIP's tokenizers"""
+    return max((len(rows) for rows in clip.tokenize(text).values()), default=1)
+
+
+class ScenePromptPacker:
+    """
+    A node that fits each scene prompt in a number of token chunks, measured with the connected CLIP's tokenizer
+    """
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "scene_1": ("STRING", {"forceInput": True}),
+                "scene_2": ("STRING", {"forceInput": True}),
+                "scene_3": ("STRING", {"forceInput": True}),
+                "clip": ("CLIP",),
+                "max_chunks": ("INT", {
+                    "default": 1,
+                    "min": 1,
+                    "max": 8,
+                    "step": 1
+                }),
+                "debug": (["enable", "disable"],),
+            },
+            "optional": {
+                "constants": ("STRING", {
+                    "forceInput": True,
+                }),
+                "trim_filler": (["enable", "disable"],),
+            },
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("scene_1", "scene_2", "scene_3", "chunk_report")
+    FUNCTION = "pack_scenes"
+    CATEGORY = "FairyTaler/Storyboard"
+
+    def pack_scenes(self, scene_1, scene_2, scene_3, clip, max_chunks, debug, constants="", trim_filler="enable"):
+        with _trace("ScenePromptPacker", debug) as trace:
+            packed, chunk_counts, report = [], [], []
+            with trace.stage("tokenize"):
+                for i, scene in enumerate([scene_1, scene_2, scene_3], 1):
+                    counts = {}
+
+                    def count_chunks(text):
+                        if text not in counts:
+                            counts[text] = _token_chunks(clip, text)
+                        return counts[text]
+
+                    text, chunks, removed = pack_prompt(scene, count_chunks, max_chunks, constants, trim_filler == "enable")
+                    packed.append(text)
+                    chunk_counts.append(chunks)
+                    line = f"Scene {i}: {chunks} chunk{'s' if chunks != 1 else ''}"
+                    if removed:
+                        line += f" (was {counts[scene]}, trimmed {removed} words)"
+                    elif chunks > max_chunks:
+                        line += f" (still over {max_chunks} after trimming)"
+                    report.append(line)
+                    trace.log("%s", line)
+
+            trace.note(chunks=chunk_counts, max_chunks=max_chunks)
+
+        return (*packed, "\n".join(report))
+
+
+try:
+    import comfy.samplers
+    _SAMPLER_NAMES = comfy.samplers.KSampler.SAMPLERS
+    _SCHEDULER_NAMES = comfy.samplers.KSampler.SCHEDULERS
+except ImportError:
+    # Outside ComfyUI (benchmarks, stubs)
+    _SAMPLER_NAMES = ["euler", "euler_ancestral", "heun", "dpm_2", "dpm_2_ancestral", "lms", "dpm_fast", "dpm_adaptive", "dpmpp_2s_ancestral", "dpmpp_sde", "dpmpp_2m", "ddim", "uni_pc", "uni_pc_bh2"]
+    _SCHEDULER_NAMES = ["normal", "karras", "exponential", "sgm_uniform", "simple", "ddim_uniform", "beta"]
+
+
+def _batch_conditioning(encoded, extra=None):
+    """
+    Stack one (cond, pooled) per scene into a single conditioning whose batch items
+    line up with the latent batch. Token lengths that differ are repeated up to their
+    least common multiple, the same way ComfyUI batches differing prompts.
+    """
+    length = 1
+    for cond, _ in encoded:
+        length = math.lcm(length, cond.shape[1])
+    cond = torch.cat([c.repeat(1, length // c.shape[1], 1) for c, _ in encoded])
+
+    options = dict(extra or {})
+    pooled = [p for _, p in encoded]
+    if all(p is not None for p in pooled):
+        options["pooled_output"] = torch.cat(pooled)
+    return [[cond, options]]
+
+
+def _zero_conditioning(conditioning):
+    """Negative conditioning for an empty negative prompt, like ConditioningZeroOut"""
+    zeroed = []
+    for cond, options in conditioning:
+        options = options.copy()
+        if options.get("pooled_output") is not None:
+            options["pooled_output"] = torch.zeros_like(options["pooled_output"][:1])
+        zeroed.append([torch.zeros_like(cond[:1]), options])
+    return zeroed
+
+
+def _empty_latent(model, vae, batch_size, width, height):
+    """Zero latent batch with the model's channel count and the VAE's downscale factor"""
+    try:
+        channels = model.get_model_object("latent_format").latent_channels
+    except AttributeError:
+        channels = 4
+    if hasattr(vae, "spacial_compression_encode"):
+        ratio = vae.spacial_compression_encode()
+    else:
+        ratio = getattr(vae, "downscale_ratio", 8)
+    return torch.zeros([batch_size, channels, height // ratio, width // ratio])
+
+
+def _batch_noise(latent, seeds):
+    """Initial noise where item i is what a separate KSampler with seeds[i] would start from"""
+    noise = []
+    for item, seed in zip(latent, seeds):
+        generator = torch.manual_seed(seed)
+        noise.append(torch.randn(item.unsqueeze(0).size(), dtype=item.dtype, layout=item.layout, generator=generator, device="cpu"))
+    return torch.cat(noise)
+
+
+def _comfy_sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, seed):
+    import comfy.sample
+    import comfy.utils
+    import latent_preview
+    callback = latent_preview.prepare_callback(model, steps)
+    return comfy.sample.sample(
+        model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image,
+        callback=callback, disable_pbar=not comfy.utils.PROGRESS_BAR_ENABLED, seed=seed
+    )
+
+
+def _sample_batch(model, vae, positive, negative, seeds, width, height, steps, cfg, sampler_name, scheduler, sample=None, trace=_NULL_TRACE):
+    """
+    Sample every scene as one latent batch and decode the batch with one VAE call.
+    positive holds one conditioning batch item per seed. sample defaults to
+    comfy.sample.sample; anything with the same signature (e.g. a CPU stub) works.
+
+    Returns an IMAGE tensor with one image per seed.
+    """
+    sample = sample or _comfy_sample
+    latent = _empty_latent(model, vae, len(seeds), width, height)
+    with trace.stage("noise"):
+        noise = _batch_noise(latent, seeds)
+    # Ancestral and SDE samplers draw their extra noise for the whole batch from the first seed
+    with trace.stage("sample"):
+        samples = sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent, seeds[0])
+    with trace.stage("decode"):
+        return _decode_latents(vae, samples)
+
+
+def _decode_latents(vae, samples, tile_size=0):
+    """
+    Decode a latent batch with one VAE call. tile_size (in pixels) decodes it in
+    overlapping tiles like VAEDecodeTiled, for when the whole batch does not fit in
+    VRAM; ComfyUI's vae.decode() already falls back to tiles when it runs out of memory.
+    """
+    if tile_size:
+        if hasattr(vae, "spacial_compression_decode"):
+            ratio = vae.spacial_compression_decode()
+        else:
+            ratio = getattr(vae, "downscale_ratio", 8)
+        tile = max(tile_size // ratio, 8)
+        images = vae.decode_tiled(samples, tile_x=tile, tile_y=tile, overlap=tile // 8)
+    else:
+        images = vae.decode(samples)
+    if images.dim() == 5:  # video VAEs return frames per item
+        images = images.reshape(-1, *images.shape[-3:])
+    return images
+
+
 class ThreeSceneGenerator:
     """
     A comprehensive node that takes 3 scene texts and generates 3 images using sampling
@@ -299,8 +1121,8 @@ class ThreeSceneGenerator:
                     "min": 0,
                     "max": 0xffffffffffffffff
                 }),
-                "sampler_name": (["euler", "euler_ancestral", "heun", "dpm_2", "dpm_2_ancestral", "lms", "dpm_fast", "dpm_adaptive", "dpmpp_2s_ancestral", "dpmpp_sde", "dpmpp_2m", "ddim", "uni_pc", "uni_pc_bh2"],),
-                "scheduler": (["normal", "karras", "exponential", "sgm_uniform", "simple", "ddim_uniform"],),
+                "sampler_name": (_SAMPLER_NAMES,),
+                "scheduler": (_SCHEDULER_NAMES,),
                 "debug": (["enable", "disable"],),
             },
             "optional": {
@@ -308,6 +1130,27 @@ class ThreeSceneGenerator:
                     "multiline": True,
                     "default": ""
                 }),
+                "batch_encode": (["enable", "disable"],),
+                "cache": (["enable", "disable"],),
+                "seed_mode": (["increment", "fixed"],),
+                "guidance": ("FLOAT", {
+                    "default": 3.5,
+                    "min": 0.0,
+                    "max": 100.0,
+                    "step": 0.1
+                }),
+                "constants": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "placeholder": "Constants to encode once and combine with the scene conditioning (e.g. SceneParser's constants output with constants_position none)"
+                }),
+                "constants_mode": (_CONSTANTS_MODES,),
+                "constants_weight": ("FLOAT", {
+                    "default": 0.3,
+                    "min": 0.0,
+                    "max": 1.0,
+                    "step": 0.05
+                }),
             },
         }
 
@@ -316,36 +1159,595 @@ class ThreeSceneGenerator:
     FUNCTION = "generate_three_scenes"
     CATEGORY = "FairyTaler/Storyboard"
 
-    def generate_three_scenes(self, scene_1, scene_2, scene_3, model, clip, vae, width, height, steps, cfg, seed, sampler_name, scheduler, debug, negative_prompt=""):
-        if debug == "enable":
-            print(f"[ThreeSceneGenerator] This node outputs conditioning for use with sampling nodes.")
-            print(f"[ThreeSceneGenerator] For actual image generation, connect the conditioning outputs to KSampler nodes.")
-
+    def generate_three_scenes(self, scene_1, scene_2, scene_3, model, clip, vae, width, height, steps, cfg, seed, sampler_name, scheduler, debug, negative_prompt="", batch_encode="enable", cache="enable", seed_mode="increment", guidance=3.5, constants="", constants_mode="concat", constants_weight=0.3):
         scenes = [scene_1, scene_2, scene_3]
-        conditionings = []
 
-        for i, scene_text in enumerate(scenes):
-            if debug == "enable":
-                print(f"[ThreeSceneGenerator] Processing scene {i+1}: {scene_text[:50]}...")
+        with _trace("ThreeSceneGenerator", debug) as trace:
+            for i, scene_text in enumerate(scenes):
+                trace.log("Processing scene %d: %s...", i + 1, scene_text[:50])
+            trace.note(input_chars=sum(len(scene) for scene in scenes), width=width, height=height, steps=steps)
+
+            # Encode positive conditioning for all scenes at once
+            use_cache = cache == "enable"
+            encoded = _encode_with_constants(clip, scenes, constants, constants_mode, constants_weight, trace,
+                                             use_cache=use_cache, batch=batch_encode == "enable")
+            positive = _batch_conditioning(encoded, {"guidance": guidance})
+
+            if negative_prompt.strip():
+                negative = _batch_conditioning(
+                    _encode_texts(clip, [negative_prompt], trace, use_cache=use_cache),
+                    {"guidance": guidance}
+                )
+            else:
+                negative = _zero_conditioning(positive)
+
+            if seed_mode == "increment":
+                seeds = [(seed + i) % 0x10000000000000000 for i in range(len(scenes))]
+            else:
+                seeds = [seed] * len(scenes)
 
-            # Encode positive conditioning
-            tokens = clip.tokenize(scene_text)
-            cond, pooled = clip.encode_from_tokens(tokens, return_pooled=True)
-            conditioning = [[cond, {"pooled_output": pooled}]]
-            conditionings.append(conditioning)
+            trace.log("Sampling %d scenes as one batch at %dx%d, seeds %s", len(scenes), width, height, seeds)
+            trace.log("Conditioning batch shape: %s", positive[0][0].shape)
 
-        placeholder_images = [] #REplace this shit
-        colors = [(255, 100, 100), (100, 255, 100), (100, 100, 255)]
+            images = _sample_batch(model, vae, positive, negative, seeds, width, height, steps, cfg,
+                                   sampler_name, scheduler, trace=trace)
 
-        for i, color in enumerate(colors):
-            img_array = np.full((height, width, 3), color, dtype=np.uint8)
-            img_tensor = torch.from_numpy(img_array.astype(np.float32) / 255.0).unsqueeze(0)
-            placeholder_images.append(img_tensor)
+            trace.log("Decoded image batch shape: %s", images.shape)
 
-            if debug == "enable":
-                print(f"[ThreeSceneGenerator] Created placeholder image {i+1} with color {color}")
+        return (images[0:1], images[1:2], images[2:3])
 
-        return (placeholder_images[0], placeholder_images[1], placeholder_images[2])
+
+def _grid_shape(layout, count, rows=0, columns=0):
+    """
+    (rows, columns) for count panels. grid is as square as possible unless rows or
+    columns are given; rows are added when rows x columns is too small.
+    """
+    if layout == "vertical":
+        return count, 1
+    if layout == "horizontal":
+        return 1, count
+    if rows and columns:
+        return max(rows, -(-count // columns)), columns
+    if rows:
+        return rows, -(-count // rows)
+    if not columns:
+        columns = math.ceil(math.sqrt(count))
+    return -(-count // columns), columns
+
+
+# Geometry by (layout, panel count, panel size, spacing, label band, rows, columns)
+_layout_cache = LRUCache(128)
+
+
+def _storyboard_geometry(layout, count, panel_width, panel_height, spacing, label_height, rows=0, columns=0):
+    """
+    Board size, panel rectangles (x, y, width, height) and label positions for count
+    panels laid out row by row. Every row has a label band of label_height above its
+    panels, and a last row that is not full is centered.
+    """
+    key = (layout, count, panel_width, panel_height, spacing, label_height, rows, columns)
+    geometry = _layout_cache.get(key)
+    if geometry is not None:
+        return geometry
+
+    rows, columns = _grid_shape(layout, count, rows, columns)
+    # Drop rows and columns that would stay empty
+    columns = max(min(columns, count), 1)
+    rows = max(min(rows, -(-count // columns)), 1)
+    board_width = columns * panel_width + (columns - 1) * spacing
+    board_height = rows * (label_height + panel_height) + (rows - 1) * spacing
+
+    panels = []
+    labels = []
+    for i in range(count):
+        row, column = divmod(i, columns)
+        in_row = min(columns, count - row * columns)
+        x = column * (panel_width + spacing) + (columns - in_row) * (panel_width + spacing) // 2
+        y = row * (label_height + panel_height + spacing)
+        panels.append((x, y + label_height, panel_width, panel_height))
+        labels.append((x + 5, y + 5))
+
+    geometry = ((board_width, board_height), tuple(panels), tuple(labels))
+    _layout_cache.put(key, geometry)
+    return geometry
+
+
+def _image_to_float(image):
+    """IMAGE tensor as floats in [0, 1] with 3 channels, keeping float dtypes and the device"""
+    if not image.is_floating_point():
+        image = _from_uint8(image, torch.float32)
+    if image.shape[-1] == 1:
+        image = image.expand(*image.shape[:-1], 3)
+    return image[..., :3]
+
+
+def _repeat_batch(image, batch_size):
+    """Repeat image [B, H, W, C] to batch_size items, cycling through its items"""
+    if image.shape[0] == batch_size:
+        return image
+    repeats = -(-batch_size // image.shape[0])
+    return image.repeat(repeats, 1, 1, 1)[:batch_size]
+
+
+_fonts = {}
+
+
+def _load_font(size=None):
+    """ImageFont.load_default() loaded once per size (None = Pillow's default size)"""
+    if size not in _fonts:
+        try:
+            _fonts[size] = ImageFont.load_default() if size is None else ImageFont.load_default(size=size)
+        except TypeError:  # Pillow < 10.1 only has the fixed-size bitmap font
+            _fonts[size] = ImageFont.load_default()
+        except Exception:
+            _fonts[size] = None
+    return _fonts[size]
+
+
+def _text_width(text, font):
+    if hasattr(font, "getlength"):
+        return font.getlength(text)
+    return ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((0, 0), text, font=font)[2]
+
+
+# Rendered text by (text, font size) -> ((offset x, offset y), coverage mask)
+_text_masks = LRUCache(1024, max_bytes=64 * 2**20, sizeof=lambda entry: entry[1].numel() * entry[1].element_size())
+# Caption lines by (text, font size, width, max lines)
+_wrapped_text = LRUCache(256)
+
+
+def _text_mask(text, size=None):
+    """Coverage mask of text drawn at (0, 0) and its top-left offset, rendered once per text and size"""
+    key = (text, size)
+    entry = _text_masks.get(key)
+    if entry is None:
+        font = _load_font(size)
+        left, top, right, bottom = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((0, 0), text, font=font)
+        mask = Image.new("L", (max(right - left, 1), max(bottom - top, 1)), 0)
+        ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font)
+        entry = ((left, top), torch.from_numpy(np.array(mask)).float() / 255.0)
+        _text_masks.put(key, entry)
+    return entry
+
+
+def _wrap_text(text, size, max_width, max_lines):
+    """Greedy word wrap to max_width pixels, ending with "..." when it needs more than max_lines lines"""
+    key = (text, size, max_width, max_lines)
+    lines = _wrapped_text.get(key)
+    if lines is not None:
+        return lines
+
+    font = _load_font(size)
+    lines = []
+    line = ""
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if line and _text_width(candidate, font) > max_width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        last = lines[-1]
+        while last and _text_width(last + "...", font) > max_width:
+            last = last[:-1].rstrip()
+        lines[-1] = last + "..."
+
+    lines = tuple(lines)
+    _wrapped_text.put(key, lines)
+    return lines
+
+
+def _draw_text(boards, position, text, size=None, fill=(0, 0, 0), bounds=None, origin=0):
+    """
+    Blend text onto every board of boards [B, H, W, 3] in place, clipped to bounds
+    (x0, y0, x1, y1). boards holds board rows origin..origin + H, positions and
+    bounds are in board coordinates.
+    """
+    (offset_x, offset_y), mask = _text_mask(text, size)
+    x0, y0, x1, y1 = bounds or (0, 0, boards.shape[2], origin + boards.shape[1])
+    x, y = position[0] + offset_x, position[1] + offset_y
+    left, top = max(x, x0), max(y, y0, origin)
+    right, bottom = min(x + mask.shape[1], x1), min(y + mask.shape[0], y1, origin + boards.shape[1])
+    if left >= right or top >= bottom:
+        return
+
+    coverage = mask[top - y:bottom - y, left - x:right - x].to(boards.device, boards.dtype).unsqueeze(-1)
+    region = boards[:, top - origin:bottom - origin, left:right]
+    region *= 1 - coverage
+    if any(fill):
+        region += coverage * (torch.tensor(fill, dtype=boards.dtype, device=boards.device) / 255.0)
+
+
+def _draw_caption(boards, caption, bounds, size, max_lines, origin=0):
+    """Wrapped white caption on a darkened strip along the bottom of the panel in bounds"""
+    x0, y0, x1, y1 = bounds
+    padding = max(size // 3, 2)
+    lines = _wrap_text(caption, size, x1 - x0 - padding * 2, max_lines)
+    if not lines:
+        return
+
+    font = _load_font(size)
+    line_height = sum(font.getmetrics()) if hasattr(font, "getmetrics") else size + 2
+    top = max(y1 - len(lines) * line_height - padding * 2, y0)
+    shade_top, shade_bottom = max(top, origin), min(y1, origin + boards.shape[1])
+    if shade_top >= shade_bottom:
+        return
+    boards[:, shade_top - origin:shade_bottom - origin, x0:x1] *= 0.4
+    for i, line in enumerate(lines):
+        _draw_text(boards, (x0 + padding, top + padding + i * line_height), line, size, (255, 255, 255), (x0, top, x1, y1), origin)
+
+
+def _plan_storyboard(images, layout, spacing, background_color, add_labels, rows=0, columns=0, trace=_NULL_TRACE):
+    """Float panels, batch size, board size, panel rectangles, label positions and background color"""
+    with trace.stage("tensor_conversion"):
+        panels = [_image_to_float(image if image.dim() == 4 else image.unsqueeze(0)) for image in images]
+    batch_size = max(panel.shape[0] for panel in panels)
+    img_height, img_width = panels[0].shape[1:3]
+    label_height = 30 if add_labels == "enable" else 0
+    with trace.stage("layout"):
+        size, rects, label_positions = _storyboard_geometry(
+            layout, len(panels), img_width, img_height, spacing, label_height, rows, columns
+        )
+    trace.note(batch_size=batch_size, panel_size=[img_width, img_height], board_size=list(size))
+    if add_labels != "enable":
+        label_positions = ()
+    background = torch.tensor(ImageColor.getrgb(background_color)[:3], dtype=panels[0].dtype) / 255.0
+    return panels, batch_size, size, rects, label_positions, background.to(panels[0].device)
+
+
+def _paint_storyboard(boards, origin, plan, captions, caption_size, caption_lines, trace=_NULL_TRACE):
+    """Paint board rows origin..origin + H of every storyboard into boards [B, H, W, 3]"""
+    panels, batch_size, _, rects, label_positions, background = plan
+    end = origin + boards.shape[1]
+
+    with trace.stage("panels"):
+        boards[:] = background
+        for panel, (x, y, width, height) in zip(panels, rects):
+            top, bottom = max(y, origin), min(y + min(panel.shape[1], height), end)
+            if top < bottom:
+                width = min(panel.shape[2], width)
+                boards[:, top - origin:bottom - origin, x:x + width] = _repeat_batch(panel[:, top - y:bottom - y, :width], batch_size)
+
+    with trace.stage("labels"):
+        for caption, (x, y, width, height) in zip(captions or [], rects):
+            if caption and caption.strip():
+                _draw_caption(boards, caption.strip(), (x, y, x + width, y + height), caption_size, caption_lines, origin)
+
+        for i, position in enumerate(label_positions):
+            _draw_text(boards, position, f"Scene {i + 1}", origin=origin)
+
+
+def _to_uint8(image):
+    """Float image in [0, 1] to uint8 the way ComfyUI's SaveImage does (truncating)"""
+    return (image * 255).clamp_(0, 255).to(torch.uint8)
+
+
+# Storyboard output precisions (torch dtype names). bfloat16 is left out because ComfyUI's
+# image nodes go through numpy, which lacks it, and uint8 because Preview/Save Image compute
+# 255 * image, which blows 8-bit levels out; 8-bit boards only exist inside save_to and StoryboardExport
+_PRECISIONS = ["float32", "float16"]
+
+
+def _from_uint8(levels, dtype):
+    """
+    uint8 levels as dtype values that SaveImage's truncating conversion maps back to
+    the same levels: the middle of each level, 1.0 for 255.
+    """
+    return levels.to(dtype).add_(0.5).div_(255).masked_fill_(levels == 255, 1.0)
+
+
+def _paint_strips(plan, tile_rows, captions, caption_size, caption_lines, trace=_NULL_TRACE):
+    """Yield (first row, uint8 strip [B, rows, W, 3]) covering the boards tile_rows rows at a time"""
+    panels, batch_size, (board_width, board_height) = plan[:3]
+    strip = torch.empty((batch_size, min(tile_rows, board_height), board_width, 3), dtype=panels[0].dtype, device=panels[0].device)
+    for origin in range(0, board_height, tile_rows):
+        view = strip[:, :min(tile_rows, board_height - origin)]
+        _paint_storyboard(view, origin, plan, captions, caption_size, caption_lines, trace)
+        with trace.stage("output_conversion"):
+            levels = _to_uint8(view)
+        yield origin, levels
+
+
+def compose_storyboard(images, layout, spacing, background_color, add_labels, captions=None, caption_size=16, caption_lines=3, rows=0, columns=0, precision="float32", trace=_NULL_TRACE):
+    """
+    Combine IMAGE tensors [B, H, W, C] into a batch of storyboards [B, H', W', 3],
+    optionally with a wrapped caption (e.g. the scene text) along the bottom of each panel.
+
+    Item i of the output is built from item i of each input; inputs with fewer items
+    are repeated to the largest batch. The boards are allocated once on the first
+    image's device and each panel batch is copied straight into its slice; only the
+    label text goes through PIL. Panels use the first image's size, larger images
+    are cropped to it.
+
+    precision float16 paints the boards a strip at a time and stores the middle of
+    each 8-bit level, so no float32 board is ever allocated and saving gives the same
+    PNG as float32.
+    """
+    plan = _plan_storyboard(images, layout, spacing, background_color, add_labels, rows, columns, trace)
+    panels, batch_size, (board_width, board_height) = plan[:3]
+    dtype = getattr(torch, precision)
+    storyboard = torch.empty((batch_size, board_height, board_width, 3), dtype=dtype, device=panels[0].device)
+    if dtype == torch.float32:
+        _paint_storyboard(storyboard, 0, plan, captions, caption_size, caption_lines, trace)
+        return storyboard
+
+    for origin, strip in _paint_strips(plan, 256, captions, caption_size, caption_lines, trace):
+        with trace.stage("output_conversion"):
+            storyboard[:, origin:origin + strip.shape[1]] = _from_uint8(strip, dtype)
+    return storyboard
+
+
+class _PNGWriter:
+    """Writes an 8-bit RGB PNG one strip of rows at a time"""
+    def __init__(self, path, width, height, compress_level=4):
+        self.path = path
+        self.width = width
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.compressor = zlib.compressobj(compress_level)
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    def write(self, rows):
+        scanlines = np.zeros((rows.shape[0], 1 + self.width * 3), dtype=np.uint8)  # filter type 0 per row
+        scanlines[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self):
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        DiskStore._remove(self.tmp_path)
+
+
+class _PILWriter:
+    """Collects strips into a uint8 image and saves it with PIL (WebP, JPEG, ...), which cannot stream"""
+    def __init__(self, path, width, height):
+        self.path = path
+        self.image = np.empty((height, width, 3), dtype=np.uint8)
+        self.row = 0
+
+    def write(self, rows):
+        self.image[self.row:self.row + rows.shape[0]] = rows
+        self.row += rows.shape[0]
+
+    def close(self):
+        Image.fromarray(self.image).save(self.path)
+        self.image = None
+
+    def abort(self):
+        self.image = None
+
+
+def _output_directory():
+    """ComfyUI's output folder, ./output outside ComfyUI"""
+    try:
+        import folder_paths
+        return os.path.abspath(folder_paths.get_output_directory())
+    except ImportError:
+        return os.path.abspath("output")
+
+
+def _output_path(path):
+    """Absolute path for a path relative to the output folder; like SaveImage, refuses anything outside it"""
+    output_directory = _output_directory()
+    full_path = os.path.abspath(os.path.join(output_directory, path))
+    if os.path.commonpath((output_directory, full_path)) != output_directory:
+        raise ValueError(f"Saving outside the output folder is not allowed: {path}")
+    return full_path
+
+
+def _storyboard_paths(path, batch_size):
+    """One output path per storyboard, numbered for batches"""
+    root, ext = os.path.splitext(path)
+    ext = ext or ".png"
+    os.makedirs(os.path.dirname(root) or ".", exist_ok=True)
+    if batch_size == 1:
+        return [root + ext]
+    return [f"{root}_{i + 1:05}{ext}" for i in range(batch_size)]
+
+
+def save_storyboard(images, path, layout, spacing, background_color, add_labels, captions=None, caption_size=16, caption_lines=3, rows=0, columns=0, tile_rows=256, keep=False, precision="float32", trace=_NULL_TRACE):
+    """
+    Compose storyboards tile_rows rows at a time and write them to path (numbered for
+    batches). PNG is written as the strips are painted, so memory stays bounded by
+    the strip size no matter how large the board is; other formats are saved by PIL
+    from a uint8 board. Returns (paths, storyboards in precision if keep else None).
+    """
+    plan = _plan_storyboard(images, layout, spacing, background_color, add_labels, rows, columns, trace)
+    panels, batch_size, (board_width, board_height) = plan[:3]
+    paths = _storyboard_paths(path, batch_size)
+    writers = []
+    storyboard = None
+    if keep:
+        storyboard = torch.empty((batch_size, board_height, board_width, 3), dtype=getattr(torch, precision), device=panels[0].device)
+
+    try:
+        for target in paths:
+            writer = _PNGWriter if target.lower().endswith(".png") else _PILWriter
+            writers.append(writer(target, board_width, board_height))
+        for origin, strip in _paint_strips(plan, tile_rows, captions, caption_size, caption_lines, trace):
+            with trace.stage("save"):
+                rows_cpu = strip.cpu().numpy()
+                for writer, item in zip(writers, rows_cpu):
+                    writer.write(item)
+            if storyboard is not None:
+                with trace.stage("output_conversion"):
+                    storyboard[:, origin:origin + strip.shape[1]] = _from_uint8(strip, storyboard.dtype)
+        with trace.stage("save"):
+            for writer in writers:
+                writer.close()
+    except Exception:
+        for writer in writers:
+            writer.abort()
+        raise
+
+    return paths, storyboard
+
+
+def _rss_mb():
+    """Current resident memory of this process in MB, None where neither /proc nor psutil is available"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().rss / 2**20, 1)
+
+
+def _peak_rss_mb():
+    """Peak resident memory over the whole life of this process in MB, None where the resource module is missing"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _preview_images(images, max_size):
+    """Panels scaled down so a storyboard of them fits in about max_size pixels"""
+    height, width = images[0].shape[-3:-1]
+    scale = min(1.0, max_size / (max(height, width) * 3))
+    if scale >= 1.0:
+        return images
+    size = (max(int(height * scale), 1), max(int(width * scale), 1))
+    return [
+        torch.nn.functional.interpolate(_image_to_float(image).movedim(-1, 1), size=size, mode="area").movedim(1, -1)
+        for image in images
+    ]
+
+
+def _write_atomic(path, writer):
+    """Call writer(tmp_path) and rename the result to path, so nobody sees a partial file"""
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        DiskStore._remove(tmp_path)
+        raise
+
+
+class ExportQueue:
+    """
+    Bounded background writer for storyboard files. submit() returns as soon as a
+    worker thread can take the job and blocks while max_pending jobs are queued or
+    running, so slow disks push back on the queue instead of piling up boards in
+    memory. flush() waits for everything submitted so far; it runs at exit too.
+    """
+    def __init__(self, workers=2, max_pending=4):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.failures = 0
+        self._executor = None
+        self._condition = threading.Condition()
+
+    def submit(self, job, *args):
+        with self._condition:
+            while self.pending >= self.max_pending:
+                self._condition.wait()
+            self.pending += 1
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="FairyTalerExport")
+        try:
+            return self._executor.submit(self._run, job, *args)
+        except Exception:
+            self._done()
+            raise
+
+    def _run(self, job, *args):
+        try:
+            return job(*args)
+        except Exception as e:
+            with self._condition:
+                self.failures += 1
+            logger.error("[StoryboardExport] Export failed: %s", e)
+            raise
+        finally:
+            self._done()
+
+    def _done(self):
+        with self._condition:
+            self.pending -= 1
+            self._condition.notify_all()
+
+    def resize(self, max_pending):
+        with self._condition:
+            self.max_pending = max_pending
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every submitted export is written, returns False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.pending == 0, timeout)
+
+
+_export_queue = ExportQueue()
+atexit.register(_export_queue.flush)
+
+# Next free file counter per (folder, filename), including files that are still being written
+_export_counters = {}
+_export_counters_lock = threading.Lock()
+
+
+def _reserve_export_names(filename_prefix, count):
+    """Output folder, file name and first counter for count new exports, like SaveImage's numbering"""
+    folder = _output_path(os.path.dirname(filename_prefix) or ".")
+    filename = os.path.basename(filename_prefix) or "storyboard"
+    os.makedirs(folder, exist_ok=True)
+
+    with _export_counters_lock:
+        counter = _export_counters.get((folder, filename))
+        if counter is None:
+            pattern = re.compile(re.escape(filename) + r"_(\d+)_\.")
+            existing = [int(m.group(1)) for m in map(pattern.match, os.listdir(folder)) if m]
+            counter = max(existing, default=0) + 1
+        _export_counters[(folder, filename)] = counter + count
+    return folder, filename, counter
+
+
+def _export_storyboards(boards, paths, file_format, quality, sheet_path, sheet):
+    """Encode and write boards [B, H, W, 3] and the contact sheet (runs on an export thread)"""
+    if boards.dtype != torch.uint8:
+        boards = _to_uint8(boards)
+    boards = boards.cpu().numpy()
+    for board, path in zip(boards, paths):
+        image = Image.fromarray(board)
+        if file_format == "png":
+            _write_atomic(path, lambda tmp: image.save(tmp, format="PNG", compress_level=4))
+        elif file_format == "webp":
+            _write_atomic(path, lambda tmp: image.save(tmp, format="WEBP", quality=quality, lossless=quality == 100))
+        else:
+            _write_atomic(path, lambda tmp: image.save(tmp, format="JPEG", quality=quality))
+    if sheet_path:
+        def write_sheet(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(sheet, f, indent=2, ensure_ascii=False)
+        _write_atomic(sheet_path, write_sheet)
+    return paths
 
 
 class StoryboardCompositor:
@@ -375,6 +1777,47 @@ class StoryboardCompositor:
                 "add_labels": (["enable", "disable"],),
                 "debug": (["enable", "disable"],),
             },
+            "optional": {
+                "caption_1": ("STRING", {"forceInput": True}),
+                "caption_2": ("STRING", {"forceInput": True}),
+                "caption_3": ("STRING", {"forceInput": True}),
+                "caption_size": ("INT", {
+                    "default": 16,
+                    "min": 8,
+                    "max": 128,
+                    "step": 1
+                }),
+                "caption_lines": ("INT", {
+                    "default": 3,
+                    "min": 1,
+                    "max": 20,
+                    "step": 1
+                }),
+                "rows": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16,
+                    "step": 1
+                }),
+                "columns": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16,
+                    "step": 1
+                }),
+                "tile_rows": ("INT", {
+                    "default": 256,
+                    "min": 16,
+                    "max": 8192,
+                    "step": 64
+                }),
+                "save_to": ("STRING", {
+                    "default": "",
+                    "placeholder": "e.g. storyboards/board.png"
+                }),
+                "output": (["storyboard", "preview"],),
+                "precision": (_PRECISIONS,),
+            },
         }
 
     RETURN_TYPES = ("IMAGE",)
@@ -382,101 +1825,130 @@ class StoryboardCompositor:
     FUNCTION = "compose_storyboard"
     CATEGORY = "FairyTaler/Storyboard"
 
-    def compose_storyboard(self, image_1, image_2, image_3, layout, spacing, background_color, add_labels, debug):
-        if debug == "enable":
-            print(f"[StoryboardCompositor] Creating {layout} storyboard with {spacing}px spacing")
-        
-        # Convert tensors to PIL Images
-        def tensor_to_pil(tensor):
-            # Convert from tensor format [batch, height, width, channels] to PIL
-            if len(tensor.shape) == 4:
-                tensor = tensor[0]  # Remove batch dimension
-            
-            # Convert from [0,1] float to [0,255] uint8
-            if tensor.dtype == torch.float32:
-                tensor = (tensor * 255).clamp(0, 255).byte()
-            
-            # Convert to numpy and then PIL
-            np_image = tensor.cpu().numpy()
-            return Image.fromarray(np_image)
-        
-        pil_images = [tensor_to_pil(img) for img in [image_1, image_2, image_3]]
-
-        img_width, img_height = pil_images[0].size
-        
-        # Calculate storyboard dimensions
-        if layout == "vertical":
-            board_width = img_width
-            board_height = img_height * 3 + spacing * 2
-        elif layout == "horizontal":
-            board_width = img_width * 3 + spacing * 2
-            board_height = img_height
-        else:
-            board_width = img_width * 2 + spacing
-            board_height = img_height * 2 + spacing
-        
-        # Add space for labels
-        label_height = 30 if add_labels == "enable" else 0
-        if layout == "vertical":
-            board_height += label_height * 3
-        elif layout == "horizontal":
-            board_height += label_height
-        else:  # grid
-            board_height += label_height * 2
-        
-        storyboard = Image.new('RGB', (board_width, board_height), background_color)
-        
-        positions = []
-        if layout == "vertical":
-            positions = [
-                (0, 0),
-                (0, img_height + spacing + label_height),
-                (0, (img_height + spacing + label_height) * 2)
-            ]
-        elif layout == "horizontal":
-            positions = [
-                (0, label_height),
-                (img_width + spacing, label_height),
-                ((img_width + spacing) * 2, label_height)
-            ]
-        else:
-            positions = [
-                (0, label_height),
-                (img_width + spacing, label_height),
-                (0, img_height + spacing + label_height * 2)
-            ]
-        
-        for i, (img, pos) in enumerate(zip(pil_images, positions)):
-            storyboard.paste(img, pos)
-            
-            if add_labels == "enable":
-                draw = ImageDraw.Draw(storyboard)
-                try:
-                    font = ImageFont.load_default()
-                except:
-                    font = None
-                
-                label_text = f"Scene {i + 1}"
-                if layout == "vertical":
-                    label_pos = (5, pos[1] - 25)
-                elif layout == "horizontal":
-                    label_pos = (pos[0] + 5, 5)
-                else:  # grid
-                    if i < 2:
-                        label_pos = (pos[0] + 5, 5)
-                    else:
-                        label_pos = (pos[0] + 5, img_height + spacing + label_height + 5)
-                
-                draw.text(label_pos, label_text, fill="black", font=font)
-        
-        # Convert back to tensor format
-        storyboard_array = np.array(storyboard).astype(np.float32) / 255.0
-        storyboard_tensor = torch.from_numpy(storyboard_array).unsqueeze(0)
-        
-        if debug == "enable":
-            print(f"[StoryboardCompositor] Created storyboard with dimensions: {storyboard.size}")
-        
-        return (storyboard_tensor,)
+    def compose_storyboard(self, image_1, image_2, image_3, layout, spacing, background_color, add_labels, debug, caption_1="", caption_2="", caption_3="", caption_size=16, caption_lines=3, rows=0, columns=0, tile_rows=256, save_to="", output="storyboard", precision="float32"):
+        with _trace("StoryboardCompositor", debug) as trace:
+            trace.log("Creating %s storyboard with %dpx spacing", layout, spacing)
+
+            images = [image_1, image_2, image_3]
+            options = dict(captions=[caption_1, caption_2, caption_3], caption_size=caption_size,
+                           caption_lines=caption_lines, rows=rows, columns=columns, precision=precision)
+
+            if save_to.strip():
+                # Stream the full size boards to disk; only keep them in memory if they are the output
+                keep = output == "storyboard"
+                paths, storyboard = save_storyboard(images, _output_path(save_to.strip()), layout, spacing, background_color, add_labels,
+                                                    tile_rows=tile_rows, keep=keep, trace=trace, **options)
+                if not keep:
+                    with trace.stage("preview"):
+                        storyboard = compose_storyboard(_preview_images(images, 1024), layout, spacing, background_color, add_labels, **options)
+                trace.log("Saved %s", ", ".join(paths))
+            else:
+                storyboard = compose_storyboard(images, layout, spacing, background_color, add_labels, trace=trace, **options)
+
+            trace.log("Created %d storyboard(s) with dimensions: %s", storyboard.shape[0], (storyboard.shape[2], storyboard.shape[1]))
+
+        return (storyboard,)
+
+
+class LatentStoryboard:
+    """
+    A node that decodes 3 scene latents with one batched VAE call and combines them into a storyboard
+    """
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "latent_1": ("LATENT",),
+                "latent_2": ("LATENT",),
+                "latent_3": ("LATENT",),
+                "vae": ("VAE",),
+                "layout": (["vertical", "horizontal", "grid"],),
+                "spacing": ("INT", {
+                    "default": 10,
+                    "min": 0,
+                    "max": 100,
+                    "step": 1
+                }),
+                "background_color": ("STRING", {
+                    "default": "white"
+                }),
+                "add_labels": (["enable", "disable"],),
+                "debug": (["enable", "disable"],),
+            },
+            "optional": {
+                "decode": (["batched", "tiled"],),
+                "tile_size": ("INT", {
+                    "default": 512,
+                    "min": 64,
+                    "max": 4096,
+                    "step": 32
+                }),
+                "caption_1": ("STRING", {"forceInput": True}),
+                "caption_2": ("STRING", {"forceInput": True}),
+                "caption_3": ("STRING", {"forceInput": True}),
+                "caption_size": ("INT", {
+                    "default": 16,
+                    "min": 8,
+                    "max": 128,
+                    "step": 1
+                }),
+                "caption_lines": ("INT", {
+                    "default": 3,
+                    "min": 1,
+                    "max": 20,
+                    "step": 1
+                }),
+                "rows": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16,
+                    "step": 1
+                }),
+                "columns": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16,
+                    "step": 1
+                }),
+                "precision": (_PRECISIONS,),
+            },
+        }
+
+    RETURN_TYPES = ("IMAGE",)
+    RETURN_NAMES = ("storyboard",)
+    FUNCTION = "decode_storyboard"
+    CATEGORY = "FairyTaler/Storyboard"
+
+    def decode_storyboard(self, latent_1, latent_2, latent_3, vae, layout, spacing, background_color, add_labels, debug, decode="batched", tile_size=512, caption_1="", caption_2="", caption_3="", caption_size=16, caption_lines=3, rows=0, columns=0, precision="float32"):
+        with _trace("LatentStoryboard", debug) as trace:
+            samples = [latent["samples"] for latent in (latent_1, latent_2, latent_3)]
+            tile_size = tile_size if decode == "tiled" else 0
+            trace.note(latent_shapes=[list(s.shape) for s in samples], decode=decode)
+
+            with trace.stage("decode"):
+                if all(s.shape[1:] == samples[0].shape[1:] for s in samples):
+                    # One VAE call for all the scenes; the panels are views into its output
+                    decoded = _decode_latents(vae, torch.cat(samples), tile_size)
+                    sizes = [s.shape[0] for s in samples]
+                    if decoded.shape[0] != sum(sizes):  # video latents: frames per item
+                        sizes = [decoded.shape[0] * size // sum(sizes) for size in sizes]
+                    images = list(torch.split(decoded, sizes))
+                else:
+                    logger.warning("[LatentStoryboard] Scene latents differ in size, decoding them one at a time")
+                    images = [_decode_latents(vae, s, tile_size) for s in samples]
+
+            trace.log("Decoded %s with %s VAE decode, creating %s storyboard", [tuple(i.shape) for i in images], decode, layout)
+            storyboard = compose_storyboard(images, layout, spacing, background_color, add_labels,
+                                            captions=[caption_1, caption_2, caption_3], caption_size=caption_size,
+                                            caption_lines=caption_lines, rows=rows, columns=columns, precision=precision, trace=trace)
+            del images
+
+            trace.log("Created %d storyboard(s) with dimensions: %s", storyboard.shape[0], (storyboard.shape[2], storyboard.shape[1]))
+
+        return (storyboard,)
 
 
 class FairyTalerStoryboard:
@@ -508,300 +1980,415 @@ class FairyTalerStoryboard:
                 "debug": (["enable", "disable"],),
             },
             "optional": {
-                "image_1": ("IMAGE",),
-                "image_2": ("IMAGE",),
-                "image_3": ("IMAGE",),
+                "image_1": ("IMAGE", {"lazy": True}),
+                "image_2": ("IMAGE", {"lazy": True}),
+                "image_3": ("IMAGE", {"lazy": True}),
+                "build_storyboard": (["auto", "enable", "disable"],),
                 "scene_constants": ("STRING", {
                     "multiline": True,
                     "default": "",
                     "placeholder": "e.g., 1 girl around 25 years old, homeless looking, at a cabin in the woods, gloomy and country aesthetic"
                 }),
-                "constants_position": (["beginning", "end", "both"],),
+                "constants_position": (["beginning", "end", "both", "none"],),
                 "constants_format": (["natural", "tags", "descriptive"],),
+                "max_input_chars": ("INT", {
+                    "default": 100000,
+                    "min": 0,
+                    "max": 10000000,
+                    "step": 1000
+                }),
+                "session_id": ("STRING", {
+                    "default": "",
+                    "placeholder": "e.g. the chat name, keeps constants across turns"
+                }),
+                "session_merge": (["merge", "replace"],),
+                "session_ttl_minutes": ("INT", {
+                    "default": 120,
+                    "min": 1,
+                    "max": 10080,
+                    "step": 10
+                }),
+                "precision": (_PRECISIONS,),
+                "add_captions": (["disable", "enable"],),
+                "caption_size": ("INT", {
+                    "default": 16,
+                    "min": 8,
+                    "max": 128,
+                    "step": 1
+                }),
+                "caption_lines": ("INT", {
+                    "default": 3,
+                    "min": 1,
+                    "max": 20,
+                    "step": 1
+                }),
+                "rows": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16,
+                    "step": 1
+                }),
+                "columns": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16,
+                    "step": 1
+                }),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "unique_id": "UNIQUE_ID",
             },
         }
 
-    RETURN_TYPES = ("STRING", "STRING", "STRING", "IMAGE", "STRING")
-    RETURN_NAMES = ("scene_1", "scene_2", "scene_3", "storyboard", "extracted_constants")
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "IMAGE", "STRING", "STRING")
+    RETURN_NAMES = ("scene_1", "scene_2", "scene_3", "storyboard", "extracted_constants", "constants")
     FUNCTION = "create_storyboard"
     CATEGORY = "FairyTaler/Storyboard"
 
-    def create_storyboard(self, ollama_text, layout, spacing, background_color, add_labels, debug, image_1=None, image_2=None, image_3=None, scene_constants="", constants_position="beginning", constants_format="natural"):
-        if debug == "enable":
-            print(f"[FairyTalerStoryboard] Creating complete storyboard from Ollama text")
-
-        # Parse scene
-        scene_pattern = r"Scene\s*(\d+):\s*(.*?)(?=Scene\s*\d+:|$)"
-        matches = re.findall(scene_pattern, ollama_text, re.DOTALL | re.IGNORECASE)
-
-        scenes = ["", "", ""]
-
-        for match in matches:
-            scene_num = int(match[0]) - 1  # Convert to 0-based index
-            if 0 <= scene_num < 3:
-                scenes[scene_num] = match[1].strip()
-
-        # Fallback: if regex doesn't work, try splitting by "Scene" keyword
-        if not any(scenes):
-            parts = re.split(r'Scene\s*\d+:', ollama_text, flags=re.IGNORECASE)
-            if len(parts) > 1:
-                for i, part in enumerate(parts[1:4]):  # Take up to 3 scenes
-                    if i < 3:
-                        scenes[i] = part.strip()
-
-        if not any(scenes):
-            paragraphs = [p.strip() for p in ollama_text.split('\n\n') if p.strip()]
-            for i, paragraph in enumerate(paragraphs[:3]):
-                scenes[i] = paragraph
-
-        extracted_constants = self._extract_constants_from_text(ollama_text, debug)
-
-        final_constants = scene_constants.strip() if scene_constants and scene_constants.strip() else extracted_constants
-
-        if final_constants:
-            scenes = self._apply_scene_constants(scenes, final_constants, constants_position, constants_format, debug)
-
-        if debug == "enable":
-            print(f"[FairyTalerStoryboard] Extracted constants: {extracted_constants}")
-            print(f"[FairyTalerStoryboard] Final constants used: {final_constants}")
-            print(f"[FairyTalerStoryboard] Final scenes with constants applied:")
-            for i, scene in enumerate(scenes):
-                print(f"Scene {i+1}: {scene[:100]}...")
-
-        if image_1 is not None and image_2 is not None and image_3 is not None:
- 
-            def tensor_to_pil(tensor):
-                if len(tensor.shape) == 4:
-                    tensor = tensor[0] 
-
-                if tensor.dtype == torch.float32:
-                    tensor = (tensor * 255).clamp(0, 255).byte()
-
-                np_image = tensor.cpu().numpy()
-                return Image.fromarray(np_image)
-
-            pil_images = [tensor_to_pil(img) for img in [image_1, image_2, image_3]]
-
-            img_width, img_height = pil_images[0].size
-
-
-            if layout == "vertical":
-                board_width = img_width
-                board_height = img_height * 3 + spacing * 2
-            elif layout == "horizontal":
-                board_width = img_width * 3 + spacing * 2
-                board_height = img_height
-            else: 
-                board_width = img_width * 2 + spacing
-                board_height = img_height * 2 + spacing
-
-            label_height = 30 if add_labels == "enable" else 0
-            if layout == "vertical":
-                board_height += label_height * 3
-            elif layout == "horizontal":
-                board_height += label_height
-            else:  # grid
-                board_height += label_height * 2
-
-            # Create the storyboard canvas
-            storyboard = Image.new('RGB', (board_width, board_height), background_color)
-
-            positions = []
-            if layout == "vertical":
-                positions = [
-                    (0, 0),
-                    (0, img_height + spacing + label_height),
-                    (0, (img_height + spacing + label_height) * 2)
-                ]
-            elif layout == "horizontal":
-                positions = [
-                    (0, label_height),
-                    (img_width + spacing, label_height),
-                    ((img_width + spacing) * 2, label_height)
-                ]
-            else: 
-                positions = [
-                    (0, label_height),
-                    (img_width + spacing, label_height),
-                    (0, img_height + spacing + label_height * 2)
-                ]
-
-            for i, (img, pos) in enumerate(zip(pil_images, positions)):
-                storyboard.paste(img, pos)
-
-                if add_labels == "enable":
+    # Index of the storyboard output in RETURN_TYPES
+    STORYBOARD_OUTPUT = 3
+
+    @classmethod
+    def wants_storyboard(cls, build_storyboard="auto", prompt=None, unique_id=None):
+        """Whether the images are needed: always/never when forced, otherwise only if the storyboard output is connected"""
+        if build_storyboard != "auto":
+            return build_storyboard == "enable"
+        if not prompt or unique_id is None:
+            return True  # no graph to look at, e.g. called from a script
+        for node in prompt.values():
+            for value in node.get("inputs", {}).values():
+                if isinstance(value, list) and len(value) == 2 and str(value[0]) == str(unique_id) and value[1] == cls.STORYBOARD_OUTPUT:
+                    return True
+        return False
+
+    @classmethod
+    def IS_CHANGED(cls, build_storyboard="auto", **kwargs):
+        # The inputs are tracked by ComfyUI. Whether the storyboard output is connected is not, and
+        # IS_CHANGED gets no graph to look at, so auto runs every time (parsing is a cache hit)
+        if build_storyboard == "auto":
+            return float("nan")
+        return build_storyboard
+
+    def check_lazy_status(self, image_1=None, image_2=None, image_3=None, build_storyboard="auto", prompt=None, unique_id=None, **kwargs):
+        # Only evaluate the image branches (usually three diffusion runs) when the storyboard is wanted,
+        # and only if all three are linked; otherwise the text board is used and ComfyUI cannot fetch unlinked inputs
+        if not self.wants_storyboard(build_storyboard, prompt, unique_id):
+            return []
+        inputs = (prompt or {}).get(str(unique_id), {}).get("inputs", {})
+        images = {"image_1": image_1, "image_2": image_2, "image_3": image_3}
+        if not all(isinstance(inputs.get(name), list) for name in images):
+            return []
+        return [name for name, image in images.items() if image is None]
+
+    def create_storyboard(self, ollama_text, layout, spacing, background_color, add_labels, debug, image_1=None, image_2=None, image_3=None, build_storyboard="auto", scene_constants="", constants_position="beginning", constants_format="natural", max_input_chars=100000, session_id="", session_merge="merge", session_ttl_minutes=120, add_captions="disable", caption_size=16, caption_lines=3, rows=0, columns=0, precision="float32", prompt=None, unique_id=None):
+        _session_constants.resize(ttl=session_ttl_minutes * 60)
+        with _trace("FairyTalerStoryboard", debug) as trace:
+            trace.log("Creating complete storyboard from Ollama text")
+
+            scenes, extracted_constants, constants = _parse_with_constants(
+                trace, ollama_text, scene_constants, constants_position, constants_format, max_input_chars, session_id, session_merge
+            )
+
+            if not self.wants_storyboard(build_storyboard, prompt, unique_id):
+                # The image inputs were not requested, so none of them were evaluated
+                trace.log("Storyboard output not used, skipped the images")
+                image_1 = image_2 = image_3 = None
+
+            if image_1 is not None and image_2 is not None and image_3 is not None:
+                captions = scenes if add_captions == "enable" else None
+                storyboard_tensor = compose_storyboard([image_1, image_2, image_3], layout, spacing, background_color, add_labels,
+                                                       captions, caption_size, caption_lines, rows, columns, precision, trace)
+
+                trace.log("Created %d storyboard(s) with dimensions: %s", storyboard_tensor.shape[0], (storyboard_tensor.shape[2], storyboard_tensor.shape[1]))
+            else:
+                with trace.stage("text_board"):
+                    storyboard = Image.new('RGB', (800, 600), background_color)
                     draw = ImageDraw.Draw(storyboard)
-                    try:
-                        font = ImageFont.load_default()
-                    except:
-                        font = None
-
-                    label_text = f"Scene {i + 1}"
-                    if layout == "vertical":
-                        label_pos = (5, pos[1] - 25)
-                    elif layout == "horizontal":
-                        label_pos = (pos[0] + 5, 5)
+                    font = _load_font()
+
+                    draw.text((10, 10), "Connect images to create visual storyboard", fill="black", font=font)
+                    draw.text((10, 40), f"Scene 1: {scenes[0][:50]}...", fill="black", font=font)
+                    draw.text((10, 70), f"Scene 2: {scenes[1][:50]}...", fill="black", font=font)
+                    draw.text((10, 100), f"Scene 3: {scenes[2][:50]}...", fill="black", font=font)
+
+                    if precision == "float32":
+                        storyboard_array = np.array(storyboard).astype(np.float32) / 255.0
+                        storyboard_tensor = torch.from_numpy(storyboard_array).unsqueeze(0)
                     else:
-                        if i < 2:
-                            label_pos = (pos[0] + 5, 5)
-                        else:
-                            label_pos = (pos[0] + 5, img_height + spacing + label_height + 5)
+                        storyboard_tensor = _from_uint8(torch.from_numpy(np.array(storyboard)).unsqueeze(0), getattr(torch, precision))
 
-                    draw.text(label_pos, label_text, fill="black", font=font)
+        return (scenes[0], scenes[1], scenes[2], storyboard_tensor, extracted_constants, constants)
 
 
-            storyboard_array = np.array(storyboard).astype(np.float32) / 255.0
-            storyboard_tensor = torch.from_numpy(storyboard_array).unsqueeze(0)  # Add batch dimension
+class StoryboardExport:
+    """
+    A node that saves storyboards as PNG, WebP or JPEG with a JSON contact sheet of the
+    scene texts, encoding and writing them in the background
+    """
+    def __init__(self):
+        pass
 
-            if debug == "enable":
-                print(f"[FairyTalerStoryboard] Created storyboard with dimensions: {storyboard.size}")
-        else:
-            storyboard = Image.new('RGB', (800, 600), background_color)
-            draw = ImageDraw.Draw(storyboard)
-            try:
-                font = ImageFont.load_default()
-            except:
-                font = None
-
-            draw.text((10, 10), "Connect images to create visual storyboard", fill="black", font=font)
-            draw.text((10, 40), f"Scene 1: {scenes[0][:50]}...", fill="black", font=font)
-            draw.text((10, 70), f"Scene 2: {scenes[1][:50]}...", fill="black", font=font)
-            draw.text((10, 100), f"Scene 3: {scenes[2][:50]}...", fill="black", font=font)
-
-            storyboard_array = np.array(storyboard).astype(np.float32) / 255.0
-            storyboard_tensor = torch.from_numpy(storyboard_array).unsqueeze(0)
-
-        return (scenes[0], scenes[1], scenes[2], storyboard_tensor, extracted_constants)
-
-    def _apply_scene_constants(self, scenes, constants, position, format_type, debug):
-        """Apply scene constants to each scene based on the specified format and position"""
-
-        if debug == "enable":
-            print(f"[FairyTalerStoryboard] Applying constants in {format_type} format at {position}")
-
-        if format_type == "tags":
-            formatted_constants = constants
-        elif format_type == "descriptive":
-            if not constants.endswith('.'):
-                formatted_constants = constants + "."
-            else:
-                formatted_constants = constants
-        else:
-            formatted_constants = constants
-            if not constants.endswith(('.', ',', ';')):
-                formatted_constants = constants + ","
-        enhanced_scenes = []
-        for i, scene in enumerate(scenes):
-            if not scene:
-                enhanced_scenes.append(scene)
-                continue
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "storyboard": ("IMAGE",),
+                "filename_prefix": ("STRING", {
+                    "default": "FairyTaler/storyboard"
+                }),
+                "format": (["png", "webp", "jpeg"],),
+                "quality": ("INT", {
+                    "default": 90,
+                    "min": 1,
+                    "max": 100,
+                    "step": 1
+                }),
+                "debug": (["enable", "disable"],),
+            },
+            "optional": {
+                "scene_1": ("STRING", {"forceInput": True}),
+                "scene_2": ("STRING", {"forceInput": True}),
+                "scene_3": ("STRING", {"forceInput": True}),
+                "extracted_constants": ("STRING", {"forceInput": True}),
+                "contact_sheet": (["enable", "disable"],),
+                "max_pending": ("INT", {
+                    "default": 4,
+                    "min": 1,
+                    "max": 64,
+                    "step": 1
+                }),
+                "wait": (["disable", "enable"],),
+            },
+        }
 
-            if position == "beginning":
-                enhanced_scene = f"{formatted_constants} {scene}"
-            elif position == "end":
-                enhanced_scene = f"{scene} {formatted_constants}"
-            else: 
-                enhanced_scene = f"{formatted_constants} {scene} {formatted_constants}"
-
-            enhanced_scenes.append(enhanced_scene)
-
-            if debug == "enable":
-                print(f"[FairyTalerStoryboard] Enhanced scene {i+1}: {enhanced_scene[:100]}...")
-
-        return enhanced_scenes
-    # De-Dupe?
-    def _extract_constants_from_text(self, text, debug):
-        """Extract suggested constants from LLM output using various patterns"""
-
-        if debug == "enable":
-            print(f"[FairyTalerStoryboard] Extracting constants from LLM text...")
-
-        # Patterns to look for constants in the LLM output
-        constant_patterns = [
-            # Direct patterns
-            r"Constants?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Scene Constants?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Character Constants?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Setting Constants?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Consistent Elements?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"Shared Details?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-
-            # Descriptive patterns
-            r"(?:For consistency|To maintain consistency|Consistent across all scenes?):\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"(?:Character|Setting|Style) (?:description|details?):\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-            r"(?:Overall|General) (?:setting|character|aesthetic):\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-
-            # Bullet point patterns
-            r"[•\-\*]\s*(?:Character|Setting|Style|Constants?):\s*(.*?)(?:\n|\n\n|$)",
-
-            # Parenthetical patterns
-            r"\((?:Constants?|Consistent elements?|For all scenes?):\s*(.*?)\)",
-
-            # Note patterns
-            r"Note:\s*(?:.*?(?:constant|consistent|throughout|all scenes)).*?:\s*(.*?)(?:\n\n|\nScene|\n[A-Z]|$)",
-        ]
-
-        extracted_constants = ""
-
-        for pattern in constant_patterns:
-            matches = re.findall(pattern, text, re.DOTALL | re.IGNORECASE)
-            if matches:
-                constants = matches[0].strip()
-                constants = re.sub(r'\s+', ' ', constants)
-                # Remove trailing punctuation that might interfere
-                constants = re.sub(r'[.!?]+$', '', constants)
-
-                if constants and len(constants) > 10:  # Ensure it's substantial
-                    extracted_constants = constants
-                    if debug == "enable":
-                        print(f"[FairyTalerStoryboard] Found constants with pattern: {pattern[:50]}...")
-                        print(f"[FairyTalerStoryboard] Extracted: {constants}")
-                    break
-
-        # Fallback: Look for character descriptions in the first scene
-        if not extracted_constants:
-            scene_pattern = r"Scene\s*1:\s*(.*?)(?=Scene\s*2:|$)"
-            scene_match = re.search(scene_pattern, text, re.DOTALL | re.IGNORECASE)
-
-            if scene_match:
-                first_scene = scene_match.group(1).strip()
-                descriptive_patterns = [
-                    r"(\d+\s+(?:girl|boy|woman|man|person)[^.]*?(?:years?\s+old|looking|appearance)[^.]*?)",
-                    r"((?:at|in)\s+(?:a|the)\s+[^.]*?(?:cabin|house|building|location)[^.]*?)",
-                    r"([^.]*?(?:aesthetic|style|mood|atmosphere)[^.]*?)",
-                ]
-
-                potential_constants = []
-                for pattern in descriptive_patterns:
-                    matches = re.findall(pattern, first_scene, re.IGNORECASE)
-                    potential_constants.extend(matches)
-
-                if potential_constants:
-                    extracted_constants = ", ".join(potential_constants[:3])  # Take first 3 elements
-                    if debug == "enable":
-                        print(f"[FairyTalerStoryboard] Fallback extraction from first scene: {extracted_constants}")
-
-        if debug == "enable":
-            if extracted_constants:
-                print(f"[FairyTalerStoryboard] Successfully extracted constants: {extracted_constants}")
-            else:
-                print(f"[FairyTalerStoryboard] No constants found in LLM output")
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("paths",)
+    FUNCTION = "export_storyboard"
+    OUTPUT_NODE = True
+    CATEGORY = "FairyTaler/Storyboard"
 
-        return extracted_constants
+    def export_storyboard(self, storyboard, filename_prefix, format, quality, debug, scene_1="", scene_2="", scene_3="", extracted_constants="", contact_sheet="enable", max_pending=4, wait="disable"):
+        with _trace("StoryboardExport", debug) as trace:
+            extension = "jpg" if format == "jpeg" else format
+            folder, filename, counter = _reserve_export_names(filename_prefix, storyboard.shape[0])
+            paths = [os.path.join(folder, f"{filename}_{counter + i:05}_.{extension}") for i in range(storyboard.shape[0])]
+
+            sheet_path = None
+            sheet = None
+            if contact_sheet == "enable":
+                sheet_path = os.path.join(folder, f"{filename}_{counter:05}_.json")
+                sheet = {
+                    "storyboards": [os.path.basename(path) for path in paths],
+                    "scenes": [scene for scene in (scene_1, scene_2, scene_3) if scene],
+                    "constants": extracted_constants,
+                    "width": storyboard.shape[2],
+                    "height": storyboard.shape[1],
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                }
+
+            _export_queue.resize(max_pending)
+            start = time.perf_counter()
+            future = _export_queue.submit(_export_storyboards, storyboard.detach(), paths, format, quality, sheet_path, sheet)
+            trace.log("Queued %d %s file(s) in %.1f ms, %d export(s) pending",
+                      len(paths), format, (time.perf_counter() - start) * 1000, _export_queue.pending)
+            trace.note(boards=len(paths), pending=_export_queue.pending)
+
+            if wait == "enable":
+                with trace.stage("save"):
+                    future.result()
+                trace.log("Wrote %s", ", ".join(paths))
+
+        return ("\n".join(paths),)
+
+
+def _levels_size(levels):
+    return levels.numel() * levels.element_size()
+
+
+# Generated scene images as uint8 levels by content key: the recently used ones in memory,
+# all of them on disk until the directory outgrows its budget
+_image_cache = LRUCache(32, max_bytes=256 * 2**20, sizeof=_levels_size)
+_image_store = DiskStore(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "images"), ".safetensors", 4 * 2**30
+)
+
+
+def _load_levels(path):
+    from safetensors.torch import load_file
+    return load_file(path)["image"]
+
+
+def _cached_image(key):
+    """uint8 levels of the image stored under key, or None"""
+    levels = _image_cache.get(key)
+    if levels is None:
+        levels = _image_store.load(key, _load_levels)
+        if levels is not None:
+            _image_cache.put(key, levels)
+    return levels
+
+
+def _store_image(key, image):
+    from safetensors.torch import save_file
+    levels = _to_uint8(image.detach().to("cpu")).contiguous()
+    _image_cache.put(key, levels)
+    _image_store.save(key, lambda path: save_file({"image": levels}, path))
+
+
+class SceneImageCacheLookup:
+    """
+    A node that looks up the image generated before for a scene prompt, model and sampler settings
+    """
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "scene_text": ("STRING", {"forceInput": True}),
+                "model": ("MODEL",),
+                "vae": ("VAE",),
+                "seed": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 0xffffffffffffffff
+                }),
+                "steps": ("INT", {
+                    "default": 20,
+                    "min": 1,
+                    "max": 100,
+                    "step": 1
+                }),
+                "cfg": ("FLOAT", {
+                    "default": 7.0,
+                    "min": 1.0,
+                    "max": 20.0,
+                    "step": 0.1
+                }),
+                "sampler_name": (_SAMPLER_NAMES,),
+                "scheduler": (_SCHEDULER_NAMES,),
+                "width": ("INT", {
+                    "default": 512,
+                    "min": 64,
+                    "max": 2048,
+                    "step": 8
+                }),
+                "height": ("INT", {
+                    "default": 512,
+                    "min": 64,
+                    "max": 2048,
+                    "step": 8
+                }),
+                "debug": (["enable", "disable"],),
+            },
+            "optional": {
+                "extra": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "placeholder": "Anything else that changes the image (negative prompt, guidance, LoRA strength, ...)"
+                }),
+            },
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("cache_key",)
+    FUNCTION = "lookup_image"
+    CATEGORY = "FairyTaler/Storyboard"
+
+    def lookup_image(self, scene_text, model, vae, seed, steps, cfg, sampler_name, scheduler, width, height, debug, extra=""):
+        with _trace("SceneImageCacheLookup", debug) as trace:
+            with trace.stage("fingerprint"):
+                key = _hash_inputs("scene_image", scene_text, _model_fingerprint(model), _vae_fingerprint(vae),
+                                   seed, steps, cfg, sampler_name, scheduler, width, height, extra)
+            # Loading it now also keeps it in memory for SceneImageCacheStore
+            with trace.stage("load"):
+                hit = _cached_image(key) is not None
+            trace.log("%s for %s... (%s)", "Hit" if hit else "Miss", scene_text[:60], _image_cache)
+            trace.note(hit=hit)
+
+        return (key,)
+
+
+class SceneImageCacheStore:
+    """
+    A node that returns the cached image for a SceneImageCacheLookup key, or stores the newly generated one
+    """
+    def __init__(self):
+        pass
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "cache_key": ("STRING", {"forceInput": True}),
+                "image": ("IMAGE", {"lazy": True}),
+                "debug": (["enable", "disable"],),
+            },
+            "optional": {
+                "max_cache_mb": ("INT", {
+                    "default": 4096,
+                    "min": 64,
+                    "max": 1048576,
+                    "step": 64
+                }),
+            },
+        }
+
+    RETURN_TYPES = ("IMAGE",)
+    RETURN_NAMES = ("image",)
+    FUNCTION = "store_image"
+    CATEGORY = "FairyTaler/Storyboard"
+
+    def check_lazy_status(self, cache_key, image=None, **kwargs):
+        # Only evaluate the image branch (sampling and decoding) on a cache miss
+        if image is None and _cached_image(cache_key) is None:
+            return ["image"]
+        return []
+
+    def store_image(self, cache_key, debug, image=None, max_cache_mb=4096):
+        _image_store.max_bytes = max_cache_mb * 2**20
+        with _trace("SceneImageCacheStore", debug) as trace:
+            if image is None:
+                with trace.stage("load"):
+                    levels = _cached_image(cache_key)
+                if levels is None:
+                    raise RuntimeError(f"Cached image {cache_key} was removed before it could be used, queue the prompt again")
+                trace.log("Using cached image %s", tuple(levels.shape))
+                trace.note(hit=True)
+                return (_from_uint8(levels, torch.float32),)
+
+            with trace.stage("save"):
+                _store_image(cache_key, image)
+            trace.log("Stored image %s (%s)", tuple(image.shape), _image_cache)
+            trace.note(hit=False)
+
+        return (image,)
 
 
 NODE_CLASS_MAPPINGS = {
     "SceneParser": SceneParser,
+    "ScenePromptPacker": ScenePromptPacker,
     "SceneToConditioning": SceneToConditioning,
     "ThreeSceneGenerator": ThreeSceneGenerator,
     "StoryboardCompositor": StoryboardCompositor,
+    "LatentStoryboard": LatentStoryboard,
     "FairyTalerStoryboard": FairyTalerStoryboard,
+    "StoryboardExport": StoryboardExport,
+    "SceneImageCacheLookup": SceneImageCacheLookup,
+    "SceneImageCacheStore": SceneImageCacheStore,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "SceneParser": "Scene Parser",
+    "ScenePromptPacker": "Scene Prompt Packer",
     "SceneToConditioning": "Scene to Conditioning",
     "ThreeSceneGenerator": "Three Scene Generator",
     "StoryboardCompositor": "Storyboard Compositor",
+    "LatentStoryboard": "Latent Storyboard",
     "FairyTalerStoryboard": "FairyTaler Storyboard",
+    "StoryboardExport": "Storyboard Export",
+    "SceneImageCacheLookup": "Scene Image Cache Lookup",
+    "SceneImageCacheStore": "Scene Image Cache Store",
 }